@@ -4,13 +4,21 @@ st.set_page_config(page_title="Sales App - SISINDOKOM", page_icon="🔒", layout
 
 import utils
 import backend as db
+import data_access
+import profiling
 
+# Skema (migrasi) & worker outbox email: sekali per proses server
+db.ensure_schema()
+db.start_notification_worker()
 
 
 # Session State
 if 'group_info' not in st.session_state: st.session_state.group_info = None
 if 'selected_kanban_opp_id' not in st.session_state: st.session_state.selected_kanban_opp_id = None
 
+# Urutan view; view berikutnya di urutan ini yang di-prefetch di background
+VIEW_ORDER = ["Kanban", "Search", "Update Price"]
+
 # Super Users
 SUPER_USERS = ["Ridho Danu S.A", "Budiono Untoro", "Neli Nursyamsyiah", "Tommy S. Purnomo", "Lie Suherman", "Ridha Evitafany"]
 
@@ -24,11 +32,15 @@ def login_page():
             res = db.validate_user(user_in, pass_in)
             if res['status'] == 200:
                 st.session_state.group_info = res['data']
+                # Panaskan cache di background sebelum view pertama dirender
+                info = res['data']
+                utils.warm_up(info['salesGroup'], info['salesName'], info['salesName'] in SUPER_USERS)
                 st.rerun()
             else:
                 st.error(res['message'])
 
 def main_app():
+    data_access.begin_run()
     group = st.session_state.group_info
     sales_name = group.get('salesName')
     sales_group = group.get('salesGroup')
@@ -44,11 +56,22 @@ def main_app():
 
     st.title(f"Sales App - {sales_group}")
     
-    t1, t2, t3 = st.tabs(["Kanban", "Search", "Update Price"])
+    # Navigasi: hanya view yang aktif yang memuat data & dirender (st.tabs menjalankan semuanya)
+    view_names = VIEW_ORDER + (["Diagnostics"] if is_super else [])
+    active_view = st.radio("Menu", view_names, horizontal=True, key="active_view", label_visibility="collapsed")
     
-    with t1: utils.tab1_kanban(sales_group, sales_name, is_super)
-    with t2: utils.tab2_dashboard(sales_group, sales_name, is_super)
-    with t3: utils.tab3_update_price(sales_group, sales_name, is_super)
+    if active_view == "Kanban": utils.tab1_kanban(sales_group, sales_name, is_super)
+    elif active_view == "Search": utils.tab2_dashboard(sales_group, sales_name, is_super)
+    elif active_view == "Update Price": utils.tab3_update_price(sales_group, sales_name, is_super)
+    elif active_view == "Diagnostics": utils.tab_diagnostics()
+
+    # Prefetch view berikutnya setelah view aktif selesai dirender (tidak menunda first paint)
+    if active_view in VIEW_ORDER:
+        next_view = VIEW_ORDER[(VIEW_ORDER.index(active_view) + 1) % len(VIEW_ORDER)]
+        utils.prefetch_view(next_view, sales_group, sales_name, is_super)
+
+    # Laporan profiling (?profile=1) setelah semua fragment selesai di run ini
+    with st.sidebar: profiling.render_sidebar()
 
 if st.session_state.group_info:
     main_app()
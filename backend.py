@@ -1,53 +1,159 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from sqlalchemy import text
-from datetime import datetime
+from datetime import datetime, timedelta
+import instrumentation
+import loader
+import migrations
+import notifier
+import snapshot
 
 # Inisialisasi Koneksi ke 'connections.postgresql' di secrets.toml
 conn = st.connection("postgresql", type="sql")
+# Timing setiap statement SQL (lihat instrumentation.py & view Diagnostics)
+instrumentation.install(conn.engine)
+
+@st.cache_resource
+def ensure_schema():
+    """
+    Menerapkan migrasi transaksional yang belum ada (sekali per proses). Migrasi di
+    CONCURRENT_MIGRATIONS (extension & build indeks CONCURRENTLY) hanya lewat
+    `python migrations.py apply`. Jika masih ada migrasi yang belum diterapkan, atau
+    migrasi gagal, app berhenti dengan error daripada berjalan di atas skema setengah jadi
+    (error tidak di-cache: rerun setelah migrasi diterapkan akan lolos).
+    """
+    applied = migrations.apply_migrations(conn.engine, concurrent=False)
+    with conn.engine.connect() as connection:
+        pending = migrations.pending_migrations(connection)
+        connection.commit()
+    if pending:
+        raise RuntimeError(f"Migrasi belum diterapkan {pending}: jalankan `python migrations.py apply` dulu.")
+    return applied
 
 # ==============================================================================
 # HELPER: EMAIL NOTIFICATION
 # ==============================================================================
 
-def send_email_notification(recipient_email, subject, body_html):
-    """Mengirim email notifikasi menggunakan konfigurasi SMTP dari secrets.toml."""
-    try:
-        smtp_config = st.secrets.get("smtp", {})
-        SMTP_SERVER = smtp_config.get("server")
-        SMTP_PORT = int(smtp_config.get("port", 587))
-        SENDER_EMAIL = smtp_config.get("email")
-        SENDER_PASSWORD = smtp_config.get("password")
-        
-        if not all([SMTP_SERVER, SENDER_EMAIL, SENDER_PASSWORD]):
-            return {"status": 500, "message": "Konfigurasi SMTP tidak lengkap di secrets.toml"}
-    except Exception as e:
-        return {"status": 500, "message": f"Gagal membaca secrets: {e}"}
+@st.cache_resource
+def start_notification_worker():
+    """Menjalankan worker outbox email di background (sekali per proses Streamlit)."""
+    smtp_config = dict(st.secrets.get("smtp", {}))
+    if not smtp_config.get("outbox_worker", True):
+        return None  # worker dijalankan sebagai proses terpisah (python notifier.py)
+    if not notifier.SmtpSender(smtp_config).is_configured():
+        print("⚠️ SMTP belum dikonfigurasi ([smtp] server & email): worker outbox tidak dijalankan")
+        return None
 
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = recipient_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body_html, 'html'))
-
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=10)
-        server.starttls() 
-        server.login(SENDER_EMAIL, SENDER_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        
-        return {"status": 200, "message": "Email sent successfully"}
-    except Exception as e:
-        return {"status": 500, "message": f"SMTP Error: {str(e)}"}
+    worker = notifier.OutboxWorker(conn.engine, smtp_config)
+    worker.start()
+    return worker
+
+# ==============================================================================
+# HELPER: CACHE DENGAN INVALIDASI TERARAH
+# ==============================================================================
+
+# TTL hanya sebagai batas atas; kesegaran data dijamin oleh versi scope yang
+# dinaikkan setiap kali ada write (lihat invalidate_opportunity).
+CACHE_TTL = 1800
+
+@st.cache_resource
+def _cache_versions():
+    """Registry versi cache per salesgroup (dibagi semua session)."""
+    return {"lock": threading.Lock(), "scopes": {}, "generation": 0}
+
+def _scope_version(sales_group):
+    """Versi data untuk scope salesgroup (TOP_MGMT naik pada setiap write)."""
+    return _cache_versions()["scopes"].get(sales_group, 0)
+
+def cache_generation():
+    """Counter global yang naik pada setiap write (untuk memo di luar cache Streamlit)."""
+    return _cache_versions()["generation"]
+
+def invalidate_opportunity(opp_id, salesgroup_id=None):
+    """Naikkan versi cache untuk salesgroup opportunity dan scope TOP_MGMT."""
+    registry = _cache_versions()
+    with registry["lock"]:
+        registry["generation"] += 1
+        for scope in {salesgroup_id, 'TOP_MGMT'} - {None}:
+            registry["scopes"][scope] = registry["scopes"].get(scope, 0) + 1
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def _cached_query(query, params, version):
+    """Query ter-cache yang key-nya ikut `version`, sehingga write langsung membuat entry lama usang."""
+    return conn.query(query, params=params, ttl=0)
+
+def _scoped_query(query, params, sales_group):
+    return _cached_query(query, params, ("scope", sales_group, _scope_version(sales_group)))
+
+# ==============================================================================
+# HELPER: PREFETCH DI BACKGROUND
+# ==============================================================================
+
+# Pool kecil yang dibagi semua session: prefetch tidak boleh menghabiskan koneksi DB.
+# Antrian juga dibatasi; saat gelombang login, warm-up yang tidak kebagian tempat dilewati.
+PREFETCH_WORKERS = 2
+PREFETCH_MAX_PENDING = 32
+
+@st.cache_resource
+def _prefetch_pool():
+    return {
+        "executor": ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch"),
+        "lock": threading.Lock(),
+        "inflight": {},
+    }
+
+def prefetch(key, fn, *args, **kwargs):
+    """
+    Jalankan `fn` di background untuk mengisi cache (hasilnya tidak dipakai langsung).
+    Permintaan dengan `key` yang sama selama masih berjalan tidak dijadwalkan ulang.
+    Return Future, atau None jika antrian penuh.
+    """
+    pool = _prefetch_pool()
+    with pool["lock"]:
+        future = pool["inflight"].get(key)
+        if future is not None and not future.done():
+            return future
+        pending = sum(1 for f in pool["inflight"].values() if not f.done())
+        if pending >= PREFETCH_MAX_PENDING:
+            return None
+
+        def run():
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                print(f"⚠️ Prefetch {key} gagal: {e}")
+
+        future = pool["executor"].submit(run)
+        pool["inflight"][key] = future
+
+    def forget(done):
+        # Juga terpanggil saat future dibatalkan selagi antri (run() tidak pernah berjalan)
+        with pool["lock"]:
+            if pool["inflight"].get(key) is done:
+                del pool["inflight"][key]
+
+    # Di luar lock: callback langsung dijalankan di thread ini jika future sudah selesai
+    future.add_done_callback(forget)
+    return future
+
+def prefetch_inflight(key):
+    """Future prefetch yang masih berjalan untuk `key` (None jika tidak ada)."""
+    pool = _prefetch_pool()
+    with pool["lock"]:
+        future = pool["inflight"].get(key)
+    return future if future is not None and not future.done() else None
 
 # ==============================================================================
 # 1. AUTHENTICATION & USER MANAGEMENT
 # ==============================================================================
 
+@instrumentation.timed()
 def validate_user(username, password):
     """Memvalidasi login user dari tabel 'users'."""
     query = "SELECT * FROM users WHERE sales_name = :u AND password = :p"
@@ -66,6 +172,7 @@ def validate_user(username, password):
         }
     return {"status": 401, "message": "Nama atau Password salah."}
 
+@instrumentation.timed()
 def get_sales_names():
     df = conn.query("SELECT sales_name FROM users ORDER BY sales_name", ttl=600)
     return df['sales_name'].tolist()
@@ -74,71 +181,556 @@ def get_sales_names():
 # 2. READ DATA (GET) - KANBAN & SEARCH
 # ==============================================================================
 
+def _authority_filter(sales_group, sales_name, is_super_user=False):
+    """Membangun klausa WHERE otoritas (bypass TOP_MGMT) beserta parameternya."""
+    clause = ""
+    params = {}
+
+    if sales_group != 'TOP_MGMT':
+        clause += " AND salesgroup_id = :sg"
+        params["sg"] = sales_group
+
+        if not is_super_user:
+            clause += " AND sales_name = :sn"
+            params["sn"] = sales_name
+
+    return clause, params
+
+@instrumentation.timed()
+def get_kanban_summary(sales_group, sales_name, is_super_user=False):
+    """
+    Rekap Kanban per stage (jumlah opportunity & total nilai) dalam satu query agregat
+    atas opportunity_headers (satu baris per opportunity_id).
+    """
+    auth_clause, params = _authority_filter(sales_group, sales_name, is_super_user)
+    query = f"""
+        SELECT 
+            stage, 
+            COUNT(*) AS opp_count, 
+            COALESCE(SUM(selling_price), 0) AS total_value
+        FROM opportunity_headers
+        WHERE 1=1 {auth_clause}
+        GROUP BY stage
+    """
+    df = _scoped_query(query, params, sales_group)
+
+    if not df.empty:
+        df['opp_count'] = pd.to_numeric(df['opp_count'], errors='coerce').fillna(0).astype(int)
+        df['total_value'] = pd.to_numeric(df['total_value'], errors='coerce').fillna(0)
+
+    return df
+
+@instrumentation.timed()
 def get_kanban_data(sales_group, sales_name, is_super_user=False):
-    """Mengambil data Kanban dengan bypass untuk TOP_MGMT."""
+    """
+    Mengambil data Kanban dengan bypass untuk TOP_MGMT.
+    Frame dibagi antar session dengan scope yang sama (tanpa pickle/copy per hit):
+    perlakukan sebagai read-only.
+    """
+    scope = _scope_key(sales_group, sales_name, is_super_user)
+    return _kanban_frame(*scope, _scope_version(scope[0]))
+
+# Kolom header berulang yang disimpan sebagai categorical
+KANBAN_CATEGORICAL_COLUMNS = ['company_name', 'sales_name', 'presales_name', 'salesgroup_id', 'stage']
+
+@st.cache_resource(ttl=CACHE_TTL, max_entries=64, show_spinner=False)
+def _kanban_frame(sales_group, sales_name, is_super_user, version):
     base_query = """
-        SELECT DISTINCT ON (opportunity_id)
+        SELECT 
             opportunity_id, 
             opportunity_name, 
             company_name,
             sales_name, 
+            presales_name,
             salesgroup_id,  
             stage, 
             selling_price, 
-            sales_notes
-        FROM opportunities
+            sales_notes,
+            updated_at
+        FROM opportunity_headers
         WHERE 1=1
     """
-    params = {}
-
     # LOGIKA BARU: Bypass filter jika TOP_MGMT
-    if sales_group != 'TOP_MGMT':
-        base_query += " AND salesgroup_id = :sg"
-        params["sg"] = sales_group
-        
-        if not is_super_user:
-            base_query += " AND sales_name = :sn"
-            params["sn"] = sales_name
-            
+    auth_clause, params = _authority_filter(sales_group, sales_name, is_super_user)
+    base_query += auth_clause
     base_query += " ORDER BY opportunity_id"
     
-    df = conn.query(base_query, params=params, ttl=60)
+    # Server-side cursor per chunk, langsung ke dtype ringkas
+    df, stats = loader.load_frame(conn.engine, base_query, params, categorical=KANBAN_CATEGORICAL_COLUMNS)
+    instrumentation.record_dataset("kanban", (sales_group, sales_name, is_super_user), stats)
     
-    if not df.empty:
-        df = df.drop_duplicates(subset=['opportunity_id'], keep='first')
-        if 'selling_price' in df.columns:
-            df['selling_price'] = pd.to_numeric(df['selling_price'], errors='coerce').fillna(0)
+    if not df.empty and 'selling_price' in df.columns:
+        df['selling_price'] = df['selling_price'].fillna(0)
             
     return df
 
+KANBAN_PAGE_SIZE = 20
+
+# Kolom urutan untuk kartu Kanban (keyset: sort_key DESC, opportunity_id DESC)
+KANBAN_SORT_KEYS = {
+    "value": "COALESCE(selling_price, 0)",
+    "recent": "COALESCE(updated_at, created_at, TIMESTAMP '1970-01-01')",
+}
+
+@instrumentation.timed()
+def get_kanban_page(sales_group, sales_name, is_super_user=False, stage="Open", sort_by="value", after=None, limit=KANBAN_PAGE_SIZE):
+    """
+    Mengambil satu halaman kartu Kanban untuk satu stage (keyset pagination).
+    `after` adalah cursor (sort_key, opportunity_id) dari kartu terakhir halaman sebelumnya.
+    Return: (DataFrame kartu, cursor halaman berikutnya atau None).
+    """
+    sort_expr = KANBAN_SORT_KEYS.get(sort_by, KANBAN_SORT_KEYS["value"])
+    auth_clause, params = _authority_filter(sales_group, sales_name, is_super_user)
+    params.update({"stage": stage, "lim": int(limit) + 1})
+
+    query = f"""
+        SELECT * FROM (
+            SELECT 
+                opportunity_id, 
+                opportunity_name, 
+                company_name,
+                sales_name, 
+                presales_name,
+                salesgroup_id,  
+                stage, 
+                selling_price, 
+                sales_notes,
+                updated_at,
+                {sort_expr} AS sort_key
+            FROM opportunity_headers
+            WHERE stage = :stage {auth_clause}
+        ) h
+    """
+    if after is not None:
+        query += " WHERE (h.sort_key, h.opportunity_id) < (:after_key, :after_id)"
+        params["after_key"], params["after_id"] = after
+
+    query += " ORDER BY h.sort_key DESC, h.opportunity_id DESC LIMIT :lim"
+
+    df = _scoped_query(query, params, sales_group)
+
+    next_cursor = None
+    if len(df) > limit:
+        df = df.iloc[:limit]
+        last = df.iloc[-1]
+        sort_key = last['sort_key']
+        sort_key = sort_key.to_pydatetime() if isinstance(sort_key, pd.Timestamp) else float(sort_key)
+        next_cursor = (sort_key, last['opportunity_id'])
+
+    if not df.empty:
+        df['selling_price'] = pd.to_numeric(df['selling_price'], errors='coerce').fillna(0)
+
+    return df, next_cursor
+
+# Snapshot dashboard: base load penuh lalu disinkronkan secara delta via updated_at
+DASHBOARD_SYNC_SECONDS = 300          # cek delta berkala walau tidak ada write di proses ini
+DASHBOARD_FULL_RELOAD_SECONDS = 21600 # reload penuh berkala (menangkap baris yang dihapus)
+DASHBOARD_DELTA_OVERLAP = timedelta(minutes=5)  # toleransi transaksi yang commit terlambat
+
+def _scope_key(sales_group, sales_name, is_super_user=False):
+    """Key scope otoritas: user dengan hak akses yang sama berbagi snapshot yang sama."""
+    if sales_group == 'TOP_MGMT':
+        return ('TOP_MGMT', None, True)
+    if is_super_user:
+        return (sales_group, None, True)
+    return (sales_group, sales_name, False)
+
+class DashboardSnapshot:
+    """
+    Dataset dashboard per scope sebagai tabel Arrow: base (slice snapshot bersama yang
+    di-mmap, atau hasil load database) + delta baris yang berubah sejak base (merge by uid).
+    Base tidak pernah disalin; baris base yang digantikan delta hanya ditandai `hidden`.
+    """
+
+    def __init__(self, sales_group, sales_name, is_super_user):
+        self.scope = (sales_group, sales_name, is_super_user)
+        self.lock = threading.Lock()
+        self.base = None      # pa.Table read-only
+        self.delta = None     # pa.Table dengan schema base (None = belum ada perubahan)
+        self.hidden = None    # posisi baris base yang digantikan delta (np.ndarray tersortir)
+        self.shared = False   # base = slice snapshot Arrow bersama (memory map)
+        self.high_water = None
+        self.data_version = 0
+        self.base_id = None  # identitas full load terakhir (unik walau objek dibuat ulang)
+        self.loaded_at = 0.0
+        self.synced_at = 0.0
+        self.synced_scope_version = None
+        self.load_stats = None
+
+    def _fetch(self, since=None, schema=None):
+        auth_clause, params = _authority_filter(*self.scope)
+        query = "SELECT * FROM opportunities WHERE 1=1" + auth_clause
+        if since is not None:
+            query += " AND updated_at > :since"
+            params["since"] = since
+        # Server-side cursor per chunk langsung ke Arrow; delta memakai schema base
+        table, stats = loader.load_table(conn.engine, query, params, schema=schema)
+        if since is None:
+            self.load_stats = stats
+        return table
+
+    def _load_base(self):
+        """
+        Base dari snapshot Arrow bersama (memory-mapped, dibagi antar proses di host ini).
+        Return (pa.Table zero-copy, high-water snapshot) atau None jika nonaktif/belum ada.
+        """
+        if not snapshot.enabled():
+            return None
+        try:
+            meta = snapshot.current_meta(conn.engine)
+            if meta is None:
+                return None
+            table = snapshot.scope_slice(meta, *self.scope)
+            self.load_stats = {"source": f"arrow {meta['version']}"}
+            return table, snapshot.high_water(meta)
+        except Exception as e:
+            print(f"⚠️ Snapshot Arrow tidak bisa dipakai, load dari database: {e}")
+            return None
+
+    def _merge_delta(self):
+        """Ambil baris yang berubah sejak high-water; base hanya ditandai, tidak disalin."""
+        if self.high_water is None:
+            # Base tanpa updated_at sama sekali: tidak ada patokan delta, load ulang penuh
+            self.base, self.delta, self.hidden, self.shared = self._fetch(), None, None, False
+            self._update_high_water(self.base)
+            return True
+
+        delta = self._fetch(since=self.high_water - DASHBOARD_DELTA_OVERLAP, schema=self.base.schema)
+        if delta.num_rows == 0:
+            return False
+        if self.delta is not None:
+            older = pc.invert(pc.is_in(self.delta['uid'], value_set=delta['uid']))
+            delta = pa.concat_tables([self.delta.filter(older), delta])
+        self.delta = delta.combine_chunks()
+        superseded = pc.is_in(self.base['uid'], value_set=self.delta['uid'])
+        self.hidden = np.flatnonzero(superseded.to_numpy(zero_copy_only=False))
+        self._update_high_water(delta)
+        return True
+
+    def _record_memory(self):
+        """Memori per proses: delta (+ base jika bukan snapshot bersama); base mmap dicatat terpisah."""
+        private = self.delta.nbytes if self.delta is not None else 0
+        if not self.shared:
+            private += self.base.nbytes
+        self.load_stats = {
+            **(self.load_stats or {}), "rows": self.num_rows, "bytes": private,
+            "shared_bytes": self.base.nbytes if self.shared else 0,
+        }
+        instrumentation.record_dataset("dashboard", self.scope, self.load_stats)
+
+    def _update_high_water(self, table):
+        if 'updated_at' in table.column_names:
+            latest = pc.max(table['updated_at']).as_py()
+            if latest is not None:
+                latest = pd.Timestamp(latest).to_pydatetime()
+                if self.high_water is None or latest > self.high_water:
+                    self.high_water = latest
+
+    @property
+    def num_rows(self):
+        if self.base is None:
+            return 0
+        delta_rows = self.delta.num_rows if self.delta is not None else 0
+        hidden_rows = len(self.hidden) if self.hidden is not None else 0
+        return self.base.num_rows - hidden_rows + delta_rows
+
+    def version_key(self):
+        """
+        Key versi data: (identitas base, counter delta). data_version saja mulai lagi dari 1
+        saat snapshot dibuat ulang setelah evict cache, sehingga bisa bentrok dengan key lama.
+        """
+        return (self.base_id, self.data_version)
+
+    def current(self):
+        """
+        (tabel, posisi hidden, version key) yang konsisten satu sama lain. Tabel = base + delta
+        (concat zero-copy); baris di posisi `hidden` sudah digantikan delta.
+        """
+        with self.lock:
+            table = self.base if self.delta is None else pa.concat_tables([self.base, self.delta])
+            return table, self.hidden, self.version_key()
+
+    def sync(self):
+        """Full load jika belum ada/terlalu tua, selain itu hanya ambil baris yang berubah."""
+        with self.lock:
+            now = time.monotonic()
+            scope_version = _scope_version(self.scope[0])
+
+            if self.base is None or now - self.loaded_at > DASHBOARD_FULL_RELOAD_SECONDS:
+                self.delta = self.hidden = None
+                base = self._load_base()
+                if base is not None:
+                    # Snapshot bersama + delta sejak snapshot dibangun
+                    (self.base, self.high_water), self.shared = base, True
+                    self._merge_delta()
+                else:
+                    self.base, self.shared, self.high_water = self._fetch(), False, None
+                    self._update_high_water(self.base)
+                self.loaded_at = now
+                self.base_id = time.time_ns()
+                self.data_version += 1
+                self._record_memory()
+
+            elif scope_version != self.synced_scope_version or now - self.synced_at > DASHBOARD_SYNC_SECONDS:
+                if self._merge_delta():
+                    self.data_version += 1
+                    self._record_memory()
+
+            self.synced_at = now
+            self.synced_scope_version = scope_version
+
+@st.cache_resource(max_entries=64)
+def _dashboard_snapshot(sales_group, sales_name, is_super_user):
+    return DashboardSnapshot(sales_group, sales_name, is_super_user)
+
+@instrumentation.timed()
+def get_dashboard_snapshot(sales_group, sales_name, is_super_user=False):
+    """Snapshot dashboard (dibagi antar session dengan scope yang sama), sudah disinkronkan."""
+    snapshot = _dashboard_snapshot(*_scope_key(sales_group, sales_name, is_super_user))
+    snapshot.sync()
+    return snapshot
+
+@instrumentation.timed()
 def get_dashboard_data(sales_group, sales_name, is_super_user=False):
-    """Mengambil data detail untuk Dashboard dengan bypass TOP_MGMT."""
-    query = "SELECT * FROM opportunities WHERE 1=1" 
-    params = {}
-    
-    if sales_group != 'TOP_MGMT':
-        query += " AND salesgroup_id = :sg"
-        params["sg"] = sales_group
-        
-        if not is_super_user:
-            query += " AND sales_name = :sn"
-            params["sn"] = sales_name
-    
-    df = conn.query(query, params=params, ttl=300)
+    """
+    Data detail Dashboard sebagai DataFrame pandas milik pemanggil (salinan penuh scope;
+    untuk script & benchmark, UI memakai tabel Arrow lewat dashboard_engine).
+    """
+    table, hidden, _ = get_dashboard_snapshot(sales_group, sales_name, is_super_user).current()
+    df = table.to_pandas(date_as_object=False)
+    if hidden is not None and len(hidden):
+        df = df.drop(index=hidden).reset_index(drop=True)
     return df
 
-def get_opportunity_details(opportunity_id):
-    """Mengambil detail item (produk/solusi) untuk satu opportunity."""
+# ==============================================================================
+# 2A. DASHBOARD PUSH-DOWN (FILTER, PROYEKSI & AGREGAT DI SQL)
+# ==============================================================================
+
+# Kolom slicer dashboard & kolom tabel detail (sekaligus whitelist identifier SQL)
+DASHBOARD_SLICER_COLUMNS = [
+    'presales_name', 'responsible_name', 'sales_name', 
+    'distributor_name', 'brand', 'pillar', 'solution', 
+    'company_name', 'vertical_industry', 'stage', 
+    'opportunity_name'
+]
+DASHBOARD_TABLE_COLUMNS = [
+    'opportunity_id', 'presales_name', 'sales_name', 'salesgroup_id', 
+    'company_name', 'opportunity_name', 'stage', 
+    'selling_price', 'pillar', 'solution', 'service', 'brand', 'pillar_product', 'solution_product'
+]
+# Kolom tanggal filter dashboard, berdasarkan prioritas (kolom pertama yang ada di tabel)
+DASHBOARD_DATE_COLUMNS = ['start_date', 'created_at']
+
+# Scope dengan jumlah baris di atas ambang ini memakai mode push-down
+PUSHDOWN_ROW_THRESHOLD = 200000
+
+def get_opportunity_columns():
+    """Daftar kolom tabel opportunities (untuk proyeksi yang aman)."""
     query = """
-        SELECT pillar, solution, service, brand, selling_price 
-        FROM opportunities 
-        WHERE opportunity_id = :oid
+        SELECT column_name FROM information_schema.columns 
+        WHERE table_name = 'opportunities'
+    """
+    df = conn.query(query, ttl=3600)
+    return df['column_name'].tolist()
+
+def get_opportunity_column_type(column):
+    """Tipe SQL kolom opportunities (mis. 'uuid', 'bigint', 'text') untuk CAST parameter."""
+    query = """
+        SELECT format_type(a.atttypid, a.atttypmod) AS column_type
+        FROM pg_attribute a
+        WHERE a.attrelid = CAST('opportunities' AS regclass) AND a.attname = :col AND NOT a.attisdropped
     """
-    df = conn.query(query, params={"oid": opportunity_id}, ttl=60)
+    df = conn.query(query, params={"col": column}, ttl=3600)
+    return df['column_type'].iloc[0] if not df.empty else 'text'
+
+def dashboard_date_column(columns=None):
+    """Kolom tanggal filter dashboard (start_date -> created_at), None jika tidak ada keduanya."""
+    existing = set(columns if columns is not None else get_opportunity_columns())
+    return next((c for c in DASHBOARD_DATE_COLUMNS if c in existing), None)
+
+@instrumentation.timed()
+def get_dashboard_scope_stats(sales_group, sales_name, is_super_user=False):
+    """Jumlah baris & rentang tanggal scope (menentukan mode in-memory vs push-down)."""
+    auth_clause, params = _authority_filter(sales_group, sales_name, is_super_user)
+    date_col = dashboard_date_column()
+    date_expr = f"CAST({date_col} AS date)" if date_col else "CAST(NULL AS date)"
+    query = f"""
+        SELECT COUNT(*) AS row_count, MIN({date_expr}) AS date_min, MAX({date_expr}) AS date_max
+        FROM opportunities
+        WHERE 1=1 {auth_clause}
+    """
+    row = _scoped_query(query, params, sales_group).iloc[0]
+    return {
+        "rows": int(row['row_count']),
+        "date_min": pd.to_datetime(row['date_min']).date() if pd.notnull(row['date_min']) else None,
+        "date_max": pd.to_datetime(row['date_max']).date() if pd.notnull(row['date_max']) else None,
+    }
+
+def _slicer_condition(col, values, param_name, params):
+    """Kondisi `col IN values`; "Unknown" di UI berarti NULL di database."""
+    conds = [f"{col} = ANY(:{param_name})"]
+    params[param_name] = [str(v) for v in values]
+    if "Unknown" in values:
+        conds.append(f"{col} IS NULL")
+    return "(" + " OR ".join(conds) + ")"
+
+def _dashboard_filter_conditions(selections, date_range, params, exclude=None):
+    """List kondisi WHERE untuk slicer (kecuali kolom `exclude`) dan rentang tanggal."""
+    existing = set(get_opportunity_columns())
+    conds = []
+    for i, col in enumerate(DASHBOARD_SLICER_COLUMNS):
+        values = selections.get(col)
+        if values and col != exclude and col in existing:
+            conds.append(_slicer_condition(col, values, f"f{i}", params))
+
+    date_col = dashboard_date_column(existing)
+    if date_range is not None and date_col:
+        params["d_start"] = date_range[0]
+        params["d_end"] = date_range[1]
+        conds.append(f"CAST({date_col} AS date) BETWEEN :d_start AND :d_end")
+    return conds
+
+@instrumentation.timed()
+def get_dashboard_option_counts(sales_group, sales_name, is_super_user=False, selections=None, date_range=None):
+    """
+    Opsi slicer + jumlah baris (cascading) dalam SATU scan: GROUPING SETS per kolom,
+    dengan COUNT(*) FILTER berisi semua filter kecuali filter kolom itu sendiri.
+    Return dict kolom -> (list opsi, dict opsi -> jumlah baris).
+    """
+    selections = selections or {}
+    existing = set(get_opportunity_columns())
+    cols = [c for c in DASHBOARD_SLICER_COLUMNS if c in existing]
+    auth_clause, params = _authority_filter(sales_group, sales_name, is_super_user)
+
+    count_exprs = []
+    for col in cols:
+        conds = _dashboard_filter_conditions(selections, date_range, params, exclude=col)
+        where = " AND ".join(conds) if conds else "TRUE"
+        count_exprs.append(f"COUNT(*) FILTER (WHERE {where}) AS n_{col}")
+
+    value_exprs = {c: f"COALESCE(CAST({c} AS text), 'Unknown')" for c in cols}
+    select_exprs = (
+        [f"{expr} AS v_{c}" for c, expr in value_exprs.items()]
+        + [f"GROUPING({expr}) AS g_{c}" for c, expr in value_exprs.items()]
+        + count_exprs
+    )
+    grouping = ", ".join(f"({expr})" for expr in value_exprs.values())
+    query = f"""
+        SELECT {", ".join(select_exprs)}
+        FROM opportunities
+        WHERE 1=1 {auth_clause}
+        GROUP BY GROUPING SETS ({grouping})
+    """
+    df = _scoped_query(query, params, sales_group)
+
+    result = {}
+    for col in cols:
+        part = df[df[f"g_{col}"] == 0]
+        selected = set(selections.get(col) or [])
+        part = part[(part[f"n_{col}"] > 0) | part[f"v_{col}"].isin(selected)].sort_values(f"v_{col}")
+        opts = part[f"v_{col}"].tolist()
+        result[col] = (opts, dict(zip(opts, part[f"n_{col}"].astype(int).tolist())))
+    return result
+
+def _dashboard_where(sales_group, sales_name, is_super_user, selections, date_range):
+    """Klausa WHERE lengkap (otoritas + slicer + tanggal) beserta parameternya."""
+    auth_clause, params = _authority_filter(sales_group, sales_name, is_super_user)
+    conds = _dashboard_filter_conditions(selections or {}, date_range, params)
+    return "WHERE 1=1" + auth_clause + "".join(f" AND {c}" for c in conds), params
+
+@instrumentation.timed()
+def get_dashboard_summary(sales_group, sales_name, is_super_user=False, selections=None, date_range=None):
+    """
+    Ringkasan metrik (agregat SQL) untuk kombinasi filter (mode push-down).
+    Baris detail diambil per halaman lewat get_dashboard_page.
+    """
+    where, params = _dashboard_where(sales_group, sales_name, is_super_user, selections, date_range)
+
+    summary_q = f"""
+        SELECT 
+            COUNT(*) AS row_count,
+            COUNT(DISTINCT opportunity_id) AS unique_opportunities,
+            COUNT(DISTINCT COALESCE(company_name, 'Unknown')) AS unique_customers,
+            COALESCE(SUM(selling_price), 0) AS total_value
+        FROM opportunities
+        {where}
+    """
+    row = _scoped_query(summary_q, params, sales_group).iloc[0]
+    return {
+        "rows": int(row['row_count']),
+        "unique_opportunities": int(row['unique_opportunities']),
+        "unique_customers": int(row['unique_customers']),
+        "total_value": float(row['total_value'] or 0),
+    }
+
+@instrumentation.timed()
+def get_dashboard_page(sales_group, sales_name, is_super_user=False, selections=None, date_range=None,
+                       sort_by='opportunity_id', descending=False, offset=0, limit=50):
+    """
+    Satu halaman tabel detail dashboard (mode push-down): ORDER BY + LIMIT/OFFSET di SQL.
+    `sort_by` harus salah satu DASHBOARD_TABLE_COLUMNS; urutan stabil lewat opportunity_id, uid.
+    """
+    existing = set(get_opportunity_columns())
+    projection = [c for c in DASHBOARD_TABLE_COLUMNS if c in existing]
+    if sort_by not in projection:
+        sort_by = 'opportunity_id'
+    where, params = _dashboard_where(sales_group, sales_name, is_super_user, selections, date_range)
+    direction = "DESC" if descending else "ASC"
+    tiebreak = ", uid" if 'uid' in existing else ""
+    query = f"""
+        SELECT {", ".join(projection)}
+        FROM opportunities
+        {where}
+        ORDER BY {sort_by} {direction} NULLS LAST, opportunity_id{tiebreak}
+        LIMIT :lim OFFSET :off
+    """
+    df = _scoped_query(query, {**params, "lim": int(limit), "off": int(offset)}, sales_group)
+    if 'selling_price' in df.columns:
+        df['selling_price'] = pd.to_numeric(df['selling_price'], errors='coerce')
     return df
 
-def search_opportunities(keyword, search_by, sales_group, sales_name, is_super_user=False):
-    """Search dengan batasan otoritas dan bypass TOP_MGMT."""
+# Export: baris dibaca dengan server-side cursor per chunk, tidak pernah dimuat sekaligus
+EXPORT_CHUNK_ROWS = 20000
+
+def stream_dashboard_rows(sales_group, sales_name, is_super_user=False, selections=None, date_range=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Generator DataFrame (maks. `chunk_rows` baris per chunk) untuk seleksi dashboard saat ini.
+    Memakai stream_results (named cursor psycopg2), jadi memori tetap terbatas berapa pun
+    jumlah barisnya. Tidak di-cache.
+    """
+    where, params = _dashboard_where(sales_group, sales_name, is_super_user, selections, date_range)
+    existing = get_opportunity_columns()
+    export_columns = DASHBOARD_TABLE_COLUMNS + [dashboard_date_column(existing)]
+    projection = ", ".join(c for c in export_columns if c in existing)
+    query = text(f"SELECT {projection} FROM opportunities {where} ORDER BY opportunity_id")
+
+    with conn.engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(query, params)
+        columns = list(result.keys())
+        for rows in result.partitions(chunk_rows):
+            chunk = pd.DataFrame(rows, columns=columns)
+            if 'selling_price' in chunk.columns:
+                chunk['selling_price'] = pd.to_numeric(chunk['selling_price'], errors='coerce')
+            yield chunk
+
+SEARCH_RESULT_LIMIT = 50
+SEARCH_CACHE_TTL = 30
+
+@st.cache_data(ttl=SEARCH_CACHE_TTL, show_spinner=False)
+def _cached_search_query(query, params, version):
+    """Cache pendek untuk pencarian identik dalam satu scope otoritas."""
+    return conn.query(query, params=params, ttl=0)
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+@instrumentation.timed()
+def search_opportunities(keyword, search_by, sales_group, sales_name, is_super_user=False, limit=SEARCH_RESULT_LIMIT):
+    """
+    Search dengan batasan otoritas dan bypass TOP_MGMT.
+    Memakai indeks trigram (pg_trgm) di opportunity_headers: cocok substring (ILIKE) atau mirip
+    per kata (<%, toleran typo), diurutkan berdasarkan skor kemiripan.
+    """
     col_map = {
         "Opportunity Name": "opportunity_name",
         "Company": "company_name",
@@ -147,35 +739,27 @@ def search_opportunities(keyword, search_by, sales_group, sales_name, is_super_u
     }
     db_col = col_map.get(search_by, "opportunity_name")
     
+    auth_clause, params = _authority_filter(sales_group, sales_name, is_super_user)
+    keyword = str(keyword or "").strip().lower()  # dinormalisasi agar cache lebih sering hit
+    params.update({"q": keyword, "kw": f"%{_escape_like(keyword)}%", "lim": int(limit)})
+
     query = f"""
-        SELECT DISTINCT ON (opportunity_id) 
-            opportunity_id, opportunity_name, company_name, sales_name, stage, selling_price 
-        FROM opportunities 
-        WHERE {db_col} ILIKE :kw
+        SELECT 
+            opportunity_id, opportunity_name, company_name, sales_name, stage, selling_price,
+            word_similarity(:q, {db_col}) AS score
+        FROM opportunity_headers 
+        WHERE ({db_col} ILIKE :kw OR :q <% {db_col}) {auth_clause}
+        ORDER BY score DESC, opportunity_id
+        LIMIT :lim
     """
-    params = {"kw": f"%{keyword}%"}
-    
-    if sales_group != 'TOP_MGMT':
-        query += " AND salesgroup_id = :sg"
-        params["sg"] = sales_group
-        
-        if not is_super_user:
-            query += " AND sales_name = :sn"
-            params["sn"] = sales_name
-            
-    query += " ORDER BY opportunity_id"
-        
-    df = conn.query(query, params=params, ttl=0)
-    
-    if not df.empty:
-        df = df.drop_duplicates(subset=['opportunity_id'], keep='first')
-        
-    return df
+    version = ("scope", sales_group, _scope_version(sales_group))
+    return _cached_search_query(query, params, version)
 
 # ==============================================================================
 # 3. MASTER DATA DROPDOWNS
 # ==============================================================================
 
+@instrumentation.timed()
 def get_master_data(table_name, column_name):
     valid_tables = ["brands", "companies", "master_pillars", "distributors", "stage_pipeline"]
     if table_name not in valid_tables:
@@ -185,10 +769,30 @@ def get_master_data(table_name, column_name):
     df = conn.query(query, ttl=3600) 
     return df[column_name].tolist()
 
+# Dropdown master data yang dipanaskan saat login (tabel, kolom)
+MASTER_DATA_WARMUP = [
+    ("brands", "brand"),
+    ("companies", "company_name"),
+    ("master_pillars", "pillar"),
+    ("distributors", "distributor_name"),
+    ("stage_pipeline", "stage"),
+]
+
+def master_data_pairs():
+    """Pasangan MASTER_DATA_WARMUP yang kolomnya benar-benar ada di database."""
+    query = """
+        SELECT table_name, column_name FROM information_schema.columns 
+        WHERE table_name IN ('brands', 'companies', 'master_pillars', 'distributors', 'stage_pipeline')
+    """
+    df = conn.query(query, ttl=3600)
+    existing = set(zip(df['table_name'], df['column_name']))
+    return [pair for pair in MASTER_DATA_WARMUP if pair in existing]
+
 # ==============================================================================
 # 4. WRITE DATA (POST/UPDATE) - TRANSACTIONAL
 # ==============================================================================
 
+@instrumentation.timed("write")
 def run_transaction(query_text, params):
     """Helper untuk eksekusi Write dengan Commit/Rollback yang aman."""
     with conn.engine.connect() as connection:
@@ -201,6 +805,7 @@ def run_transaction(query_text, params):
             trans.rollback()
             return False, str(e)
 
+@instrumentation.timed("write")
 def log_sales_activity(opp_id, opp_name, user, action, field, old_val, new_val):
     """Mencatat log dengan Opportunity ID sebagai referensi utama."""
     try:
@@ -222,46 +827,101 @@ def log_sales_activity(opp_id, opp_name, user, action, field, old_val, new_val):
 # 5. LUMP SUM PRICE UPDATE (HEADER)
 # ==============================================================================
 
+@instrumentation.timed()
 def get_sales_opportunity_header(opp_id):
-    """Mengambil data header dari opportunities (LIMIT 1)."""
+    """
+    Mengambil data header dari opportunity_headers (satu baris per opportunity).
+    `updated_at` dipakai sebagai token versi untuk update stage / lump sum, jadi selalu
+    dibaca langsung dari database (tidak di-cache).
+    """
     query = """
         SELECT 
             opportunity_id, opportunity_name, company_name, 
-            sales_name, presales_name, stage, selling_price, sales_notes
-        FROM opportunities
+            sales_name, presales_name, stage, selling_price, sales_notes, updated_at
+        FROM opportunity_headers
         WHERE opportunity_id = :oid
-        LIMIT 1
     """
     df = conn.query(query, params={"oid": opp_id}, ttl=0)
     if not df.empty:
         return df.iloc[0].to_dict()
     return None
 
-def update_lump_sum_price_header(opp_id, new_price, user_name):
-    """Update harga total (Lump Sum) di seluruh baris opportunity terkait."""
+# ==============================================================================
+# OPTIMISTIC CONCURRENCY (TOKEN VERSI = opportunity_headers.updated_at)
+# ==============================================================================
+# Header dikunci FOR UPDATE hanya selama statement/transaksi tulis (milidetik), tidak
+# selama user mengedit. Jika token versi dari UI tidak lagi sama (user lain sudah
+# menyimpan), guard kosong: tidak ada baris yang di-update dan pemanggil mendapat 409.
+# Penulis yang menunggu lock akan mengevaluasi ulang guard terhadap versi terbaru.
+
+_VERSION_GUARD = "h.updated_at IS NOT DISTINCT FROM :expected"
+
+def _version_params(expected_updated_at):
+    """Parameter guard versi; None/NaT hanya cocok dengan header yang updated_at-nya NULL."""
+    if expected_updated_at is None or pd.isna(expected_updated_at):
+        return {"expected": None}
+    return {"expected": pd.Timestamp(expected_updated_at).to_pydatetime()}
+
+def _write_rejected(connection, opp_id):
+    """Guard kosong: bedakan opportunity yang tidak ada (404) dari edit yang basi (409)."""
+    exists = connection.execute(
+        text("SELECT 1 FROM opportunity_headers WHERE opportunity_id = :oid"), {"oid": opp_id}
+    ).first()
+    if not exists:
+        return {"status": 404, "message": "Opportunity ID not found"}
+    # Cache sesi ini sudah basi; pastikan data terbaru dimuat saat user memuat ulang
+    invalidate_opportunity(opp_id)
+    return {"status": 409, "message": "Opportunity sudah diubah oleh user lain. Muat ulang data lalu ulangi perubahan Anda."}
+
+# Satu round trip: kunci & cek versi header, update semua line item, tulis log jika berubah.
+LUMP_SUM_PRICE_SQL = f"""
+    WITH guard AS (
+        SELECT h.opportunity_id, h.opportunity_name, h.salesgroup_id, h.selling_price AS old_price
+        FROM opportunity_headers h
+        WHERE h.opportunity_id = :oid AND {_VERSION_GUARD}
+        FOR UPDATE
+    ),
+    upd AS (
+        UPDATE opportunities o
+        SET selling_price = :price, updated_at = NOW()
+        FROM guard g
+        WHERE o.opportunity_id = g.opportunity_id
+        RETURNING o.uid
+    ),
+    logged AS (
+        INSERT INTO activity_logs_sales 
+        (timestamp, opportunity_id, opportunity_name, user_name, action, old_value, new_value)
+        SELECT 
+            NOW(), g.opportunity_id, g.opportunity_name, :usr, 'UPDATE PRICE - Lump Sum Selling Price',
+            CAST(COALESCE(g.old_price, 0) AS text), CAST(:price AS text)
+        FROM guard g
+        WHERE COALESCE(g.old_price, 0) <> :price
+    )
+    SELECT g.salesgroup_id, (SELECT COUNT(*) FROM upd) AS changed_rows
+    FROM guard g
+"""
+
+@instrumentation.timed("write")
+def update_lump_sum_price_header(opp_id, new_price, user_name, expected_updated_at):
+    """
+    Update harga total (Lump Sum) di seluruh baris opportunity terkait.
+    `expected_updated_at` (wajib): updated_at header saat data dibaca; jika berbeda -> 409.
+    """
     try:
         with conn.engine.connect() as connection:
             trans = connection.begin()
             try:
-                old_data = connection.execute(
-                    text("SELECT selling_price, opportunity_name FROM opportunities WHERE opportunity_id = :oid LIMIT 1"),
-                    {"oid": opp_id}
-                ).mappings().first()
-
-                old_val = old_data['selling_price'] if old_data and old_data['selling_price'] else 0
-                opp_name = old_data['opportunity_name'] if old_data else "Unknown"
-
-                upd_q = text("""
-                    UPDATE opportunities 
-                    SET selling_price = :price, updated_at = NOW() 
-                    WHERE opportunity_id = :oid
-                """)
-                connection.execute(upd_q, {"price": new_price, "oid": opp_id})
+                result = connection.execute(text(LUMP_SUM_PRICE_SQL), {
+                    "oid": opp_id, "price": float(new_price), "usr": str(user_name),
+                    **_version_params(expected_updated_at)
+                }).mappings().first()
 
-                if float(old_val) != float(new_price):
-                    log_sales_activity(opp_id, opp_name, user_name, "UPDATE PRICE", "Lump Sum Selling Price", str(old_val), str(new_price))
+                if result is None:
+                    trans.rollback()
+                    return _write_rejected(connection, opp_id)
 
                 trans.commit()
+                invalidate_opportunity(opp_id, result['salesgroup_id'])
                 return {"status": 200, "message": f"Harga berhasil diupdate menjadi Rp {new_price:,.0f}"}
             except Exception as e:
                 trans.rollback()
@@ -269,8 +929,9 @@ def update_lump_sum_price_header(opp_id, new_price, user_name):
     except Exception as e:
         return {"status": 500, "message": str(e)}
 
+@instrumentation.timed()
 def get_opportunity_line_items(opp_id):
-    """Mengambil detail item beserta UID dan harga saat ini."""
+    """Mengambil detail item beserta UID dan harga saat ini (tidak di-cache: sumber editor harga)."""
     query = """
         SELECT 
             uid, product_id, pillar, solution, brand, service, cost, selling_price
@@ -280,10 +941,64 @@ def get_opportunity_line_items(opp_id):
     """
     return conn.query(query, params={"oid": opp_id}, ttl=0)
 
-def update_line_item_prices(updates_list, user_name, opp_id, opp_name):
+# Update harga per item secara set-based: nilai lama diambil dari self-join (snapshot
+# sebelum update), hanya baris yang harganya berubah yang di-update & dicatat di log.
+# Seperti lump sum & stage, header dikunci lebih dulu (guard) baru line item, jadi semua
+# penulis mengambil lock dengan urutan yang sama (tanpa deadlock header <-> opportunities).
+# Action log dipotong 50 karakter, sama seperti log_sales_activity.
+# Array uid di-CAST ke tipe kolom uid ({uid_type}), bukan kolomnya ke text, agar indeks uid terpakai.
+LINE_ITEM_PRICE_BATCH_SQL = f"""
+    WITH guard AS (
+        SELECT h.opportunity_id, h.salesgroup_id
+        FROM opportunity_headers h
+        WHERE h.opportunity_id = :oid AND {_VERSION_GUARD}
+        FOR UPDATE
+    ),
+    changes AS (
+        SELECT * FROM unnest(CAST(:uids AS {{uid_type}}[]), CAST(:prices AS numeric[])) AS c(uid, price)
+    ),
+    upd AS (
+        UPDATE opportunities o
+        SET selling_price = c.price, updated_at = NOW()
+        FROM guard g, changes c, opportunities prev
+        WHERE o.opportunity_id = g.opportunity_id
+          AND o.uid = c.uid
+          AND prev.uid = o.uid
+          AND COALESCE(prev.selling_price, 0) <> c.price
+        RETURNING o.uid, prev.selling_price AS old_price, c.price AS new_price, prev.solution, prev.brand
+    ),
+    logged AS (
+        INSERT INTO activity_logs_sales 
+        (timestamp, opportunity_id, opportunity_name, user_name, action, old_value, new_value)
+        SELECT 
+            NOW(), :oid, :oname, :usr, 
+            LEFT('UPD PRICE - ' || COALESCE(CAST(solution AS text), 'None') || ' (' || COALESCE(CAST(brand AS text), 'None') || ')', 50),
+            CAST(COALESCE(old_price, 0) AS text), 
+            CAST(new_price AS text)
+        FROM upd
+    )
+    SELECT g.salesgroup_id, (SELECT COUNT(*) FROM upd) AS changed_rows
+    FROM guard g
+"""
+
+# Penerima notifikasi presales untuk satu opportunity
+PRESALES_EMAIL_SQL = """
+    SELECT o.presales_name, p.email 
+    FROM opportunities o
+    JOIN presales p ON o.presales_name = p.presales_name
+    WHERE o.opportunity_id = :oid
+    LIMIT 1
+"""
+
+def line_item_price_batch_sql():
+    return LINE_ITEM_PRICE_BATCH_SQL.format(uid_type=get_opportunity_column_type('uid'))
+
+@instrumentation.timed("write")
+def update_line_item_prices(updates_list, user_name, opp_id, opp_name, expected_updated_at):
     """
     Update selling_price HANYA pada baris yang diubah oleh Sales.
     Versi Perbaikan: opp_id di-cast sebagai string karena berupa kombinasi huruf & angka.
+    `expected_updated_at` (wajib): updated_at header saat data dibaca; jika berbeda -> 409.
     """
     try:
         # 1. SANITASI DATA MASTER: Gunakan str() untuk ID karena mengandung huruf (misal: ENT2...)
@@ -294,83 +1009,46 @@ def update_line_item_prices(updates_list, user_name, opp_id, opp_name):
         with conn.engine.connect() as connection:
             trans = connection.begin()
             try:
-                for item in updates_list:
-                    # Sanitasi data per baris
-                    clean_uid = str(item['uid'])
-                    clean_new_price = float(item['selling_price'])
-
-                    # Ambil data lama untuk referensi log
-                    old_data = connection.execute(
-                        text("SELECT selling_price, solution, brand FROM opportunities WHERE uid = :uid"),
-                        {"uid": clean_uid}
-                    ).mappings().first()
-
-                    if old_data:
-                        old_val = float(old_data['selling_price'] or 0)
-                        item_desc = f"{old_data['solution']} ({old_data['brand']})"
-
-                        if old_val != clean_new_price:
-                            # 1. Update baris tersebut
-                            connection.execute(
-                                text("UPDATE opportunities SET selling_price = :price, updated_at = NOW() WHERE uid = :uid"),
-                                {"price": clean_new_price, "uid": clean_uid}
-                            )
+                # Sanitasi data per baris
+                uids = [str(item['uid']) for item in updates_list]
+                prices = [float(item['selling_price']) for item in updates_list]
 
-                            # 2. Catat Log (Action dipotong agar tidak melebih 50 karakter)
-                            log_q = text("""
-                                INSERT INTO activity_logs_sales 
-                                (timestamp, opportunity_id, opportunity_name, user_name, action, old_value, new_value)
-                                VALUES (NOW(), :oid, :oname, :usr, :act, :old, :new)
-                            """)
-                            connection.execute(log_q, {
-                                "oid": clean_opp_id, 
-                                "oname": clean_opp_name, 
-                                "usr": clean_user, 
-                                "act": f"UPD PRICE - {item_desc}"[:50], 
-                                "old": str(old_val), 
-                                "new": str(clean_new_price)
-                            })
+                # Satu statement: update semua baris yang benar-benar berubah + tulis semua log
+                result = connection.execute(text(line_item_price_batch_sql()), {
+                    "uids": uids, 
+                    "prices": prices,
+                    "oid": clean_opp_id, 
+                    "oname": clean_opp_name, 
+                    "usr": clean_user,
+                    **_version_params(expected_updated_at)
+                }).mappings().first()
 
-                trans.commit()
+                if result is None:
+                    trans.rollback()
+                    return _write_rejected(connection, clean_opp_id)
+
+                # =================================================================
+                # NOTIFIKASI PRESALES (masuk outbox dalam transaksi yang sama)
+                # =================================================================
+                # SAVEPOINT: kegagalan notifikasi tidak membatalkan update harga
                 try:
-                    # 1. Cari nama Presales dan Email-nya berdasarkan Opportunity ID
-                    email_q = text("""
-                        SELECT o.presales_name, p.email 
-                        FROM opportunities o
-                        JOIN presales p ON o.presales_name = p.presales_name
-                        WHERE o.opportunity_id = :oid
-                        LIMIT 1
-                    """)
-                    email_data = connection.execute(email_q, {"oid": clean_opp_id}).mappings().first()
+                    with connection.begin_nested():
+                        # 1. Cari nama Presales dan Email-nya berdasarkan Opportunity ID
+                        email_data = connection.execute(text(PRESALES_EMAIL_SQL), {"oid": clean_opp_id}).mappings().first()
                     
-                    if email_data and email_data['email']:
-                        target_email = email_data['email']
-                        p_name = email_data['presales_name']
-                        
-                        # 2. Rangkai pesan sesuai instruksi
-                        subject = f"[Reminder] Update Cost/Solution: {clean_opp_name}"
-                        body_html = f"""
-                        <h3>📢 Notifikasi Harga Jual (Selling Price) Terupdate</h3>
-                        <p>Halo <b>{p_name}</b>,</p>
-                        <p>Data Entry (<b>{clean_user}</b>) baru saja menginput atau memperbarui <i>Selling Price</i> untuk Opportunity berikut:</p>
-                        <ul>
-                            <li><b>Opportunity Name:</b> {clean_opp_name}</li>
-                            <li><b>Opportunity ID:</b> {clean_opp_id}</li>
-                        </ul>
-                        <p style="padding: 10px; border-left: 4px solid #28a745; background-color: #f9f9f9;">
-                        <b>Pesan:</b><br>
-                        Jika ada <i>update cost</i> atau <i>update solution details</i> terkait penawaran harga ini, mohon bantu update di Presales App.
-                        </p>
-                        <br>
-                        <p><i>Terima kasih,<br>Krisa Kurniawan (via Sales App System)</i></p>
-                        """
-                        
-                        # 3. Kirim Email meminjam fungsi yang sudah ada
-                        send_email_notification(target_email, subject, body_html)
+                        if email_data and email_data['email']:
+                            # 2. Masukkan event ke outbox; worker menggabungkannya menjadi digest per presales
+                            notifier.enqueue_event(
+                                connection, email_data['email'], email_data['presales_name'],
+                                notifier.EVENT_PRICE_UPDATE,
+                                {"opportunity_id": clean_opp_id, "opportunity_name": clean_opp_name, "actor": clean_user}
+                            )
                         
                 except Exception as email_err:
-                    print(f"⚠️ Gagal mengirim notifikasi email ke presales: {email_err}")
-                # =================================================================
+                    print(f"⚠️ Gagal menyiapkan notifikasi email ke presales: {email_err}")
+
+                trans.commit()
+                invalidate_opportunity(clean_opp_id, result['salesgroup_id'])
 
                 return {"status": 200, "message": "Harga per item berhasil disimpan."}
             except Exception as e:
@@ -383,89 +1061,90 @@ def update_line_item_prices(updates_list, user_name, opp_id, opp_name):
 # 6. UNIFIED STAGE UPDATE WITH NOTIFICATION
 # ==============================================================================
 
-def update_stage_with_notification(opp_id, new_stage, notes, user_actor):
+# Satu round trip: kunci & cek versi header, update stage, tulis log jika berubah.
+# Line item (untuk email) dan email presales ikut dikembalikan agar notifikasi
+# tidak perlu query tambahan.
+STAGE_UPDATE_SQL = f"""
+    WITH guard AS (
+        SELECT 
+            h.opportunity_id, h.opportunity_name, h.company_name, 
+            h.presales_name, h.salesgroup_id, h.stage AS old_stage
+        FROM opportunity_headers h
+        WHERE h.opportunity_id = :oid AND {_VERSION_GUARD}
+        FOR UPDATE
+    ),
+    upd AS (
+        UPDATE opportunities o
+        SET stage = :stg, sales_notes = :note, updated_at = NOW()
+        FROM guard g
+        WHERE o.opportunity_id = g.opportunity_id
+        RETURNING o.solution, o.brand, o.cost
+    ),
+    logged AS (
+        INSERT INTO activity_logs_sales 
+        (timestamp, opportunity_id, opportunity_name, user_name, action, field_changed, old_value, new_value)
+        SELECT NOW(), g.opportunity_id, g.opportunity_name, :usr, 'UPDATE STAGE', 'stage', g.old_stage, :stg
+        FROM guard g
+        WHERE g.old_stage IS DISTINCT FROM :stg
+    )
+    SELECT 
+        g.*,
+        (SELECT p.email FROM presales p WHERE p.presales_name = g.presales_name LIMIT 1) AS presales_email,
+        (SELECT json_agg(json_build_object('solution', u.solution, 'brand', u.brand, 'cost', u.cost)) FROM upd u) AS items
+    FROM guard g
+"""
+
+@instrumentation.timed("write")
+def update_stage_with_notification(opp_id, new_stage, notes, user_actor, expected_updated_at):
     """
     Fungsi terpadu untuk update stage ke tabel opportunities.
     Jika berubah ke Won/Lost, sistem akan otomatis mengirim email ke Presales.
+    `expected_updated_at` (wajib): updated_at header saat data dibaca; jika berbeda -> 409.
     """
     try:
         with conn.engine.connect() as connection:
             trans = connection.begin()
             try:
-                # 1. AMBIL DATA LAMA
-                q_check = text("""
-                    SELECT stage, presales_name, opportunity_name, company_name 
-                    FROM opportunities 
-                    WHERE opportunity_id = :oid 
-                    LIMIT 1
-                """)
-                current_data = connection.execute(q_check, {"oid": opp_id}).mappings().first()
-                
-                if not current_data:
+                # 1. UPDATE + AMBIL DATA LAMA + LOG (satu statement)
+                current_data = connection.execute(text(STAGE_UPDATE_SQL), {
+                    "oid": opp_id, "stg": new_stage, "note": notes, "usr": user_actor,
+                    **_version_params(expected_updated_at)
+                }).mappings().first()
+
+                if current_data is None:
                     trans.rollback()
-                    return {"status": 404, "message": "Opportunity ID not found"}
+                    return _write_rejected(connection, opp_id)
 
-                old_stage = current_data['stage']
+                old_stage = current_data['old_stage']
                 presales_name = current_data['presales_name']
-                opp_name = current_data['opportunity_name']
-                comp_name = current_data['company_name']
-
-                # 2. UPDATE STAGE DI DATABASE
-                upd_q = text("""
-                    UPDATE opportunities 
-                    SET stage = :stg, sales_notes = :note, updated_at = NOW() 
-                    WHERE opportunity_id = :oid
-                """)
-                connection.execute(upd_q, {"stg": new_stage, "note": notes, "oid": opp_id})
-
-                # 3. LOG ACTIVITY
-                if old_stage != new_stage:
-                    log_q = text("""
-                        INSERT INTO activity_logs_sales 
-                        (timestamp, opportunity_id, opportunity_name, user_name, action, field_changed, old_value, new_value)
-                        VALUES (NOW(), :oid, :oname, :usr, 'UPDATE STAGE', 'stage', :old, :new)
-                    """)
-                    connection.execute(log_q, {
-                        "oid": opp_id, "oname": opp_name, "usr": user_actor, 
-                        "old": old_stage, "new": new_stage
-                    })
-
-                trans.commit()
 
                 # =================================================================
-                # 4. LOGIKA NOTIFIKASI EMAIL
+                # 2. LOGIKA NOTIFIKASI EMAIL (masuk outbox dalam transaksi yang sama)
                 # =================================================================
                 target_stages = ['Closed Won', 'Closed Lost']
                 
-                if new_stage in target_stages and old_stage not in target_stages:
-                    q_email = "SELECT email FROM presales WHERE presales_name = :pname LIMIT 1"
-                    res_email = conn.query(q_email, params={"pname": presales_name}, ttl=0)
-                    
-                    if not res_email.empty and res_email.iloc[0]['email']:
-                        presales_email = res_email.iloc[0]['email']
-                        
-                        items_df = conn.query("SELECT solution, brand, cost FROM opportunities WHERE opportunity_id = :oid", params={"oid": opp_id}, ttl=0)
-                        email_subject = f"[Action Required] Opportunity {new_stage}: {opp_name}"
-                        
-                        items_html = "<ul>"
-                        for _, item in items_df.iterrows():
-                            cost_fmt = f"{float(item['cost']):,.0f}" if pd.notnull(item['cost']) else "0"
-                            items_html += f"<li>{item['solution']} ({item['brand']}) - Initial Cost: Rp {cost_fmt}</li>"
-                        items_html += "</ul>"
-
-                        email_body = f"""
-                        <h3>Status Update: {new_stage.upper()}</h3>
-                        <p>Halo <b>{presales_name}</b>,</p>
-                        <p>Opportunity berikut telah diubah statusnya menjadi <b>{new_stage}</b> oleh Sales ({user_actor}).</p>
-                        <p><b>Customer:</b> {comp_name}<br><b>Opportunity:</b> {opp_name}</p>
-                        <p>Mohon segera login ke Presales App dan update <b>Final Cost</b> (Harga Beli/Modal Real) untuk item-item berikut:</p>
-                        {items_html}
-                        <p><i>Terima kasih,<br>Sales App Automation</i></p>
-                        """
-                        try:
-                            send_email_notification(presales_email, email_subject, email_body)
-                        except Exception as e:
-                            print(f"⚠️ Email failed: {e}")
+                if new_stage in target_stages and old_stage not in target_stages and current_data['presales_email']:
+                    # SAVEPOINT: kegagalan notifikasi tidak membatalkan update stage
+                    try:
+                        with connection.begin_nested():
+                            notifier.enqueue_event(
+                                connection, current_data['presales_email'], presales_name,
+                                notifier.EVENT_STAGE_CLOSED,
+                                {
+                                    "opportunity_id": opp_id, "opportunity_name": current_data['opportunity_name'],
+                                    "company_name": current_data['company_name'], "stage": new_stage, "actor": user_actor,
+                                    "items": [
+                                        {"solution": i['solution'], "brand": i['brand'],
+                                         "cost": float(i['cost']) if i['cost'] is not None else None}
+                                        for i in (current_data['items'] or [])
+                                    ]
+                                }
+                            )
+                    except Exception as e:
+                        print(f"⚠️ Email failed: {e}")
+
+                trans.commit()
+                invalidate_opportunity(opp_id, current_data['salesgroup_id'])
 
                 return {"status": 200, "message": f"Stage updated to {new_stage}."}
 
@@ -474,4 +1153,4 @@ def update_stage_with_notification(opp_id, new_stage, notes, user_actor):
                 return {"status": 500, "message": f"Transaction Error: {str(e)}"}
 
     except Exception as e:
-        return {"status": 500, "message": str(e)}
\ No newline at end of file
+        return {"status": 500, "message": str(e)}
@@ -0,0 +1,10 @@
+"""
+Benchmark backend.py terhadap Postgres lokal dengan data sintetis.
+
+    python -m bench generate --size 100k        # isi database benchmark
+    python -m bench run --size 100k             # ukur & simpan hasil ke bench/results/
+    python -m bench compare A.json B.json       # bandingkan dua hasil (mis. antar commit)
+
+URL database dari --url atau env BENCH_DATABASE_URL. Import backend tetap membutuhkan
+[connections.postgresql] di secrets.toml; koneksinya diganti ke database benchmark saat run.
+"""
@@ -0,0 +1,208 @@
+"""Generator data sintetis: opportunities, users, presales & activity_logs_sales."""
+import io
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+import migrations
+
+# Jumlah line item per ukuran dataset
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+STAGES = ["Open", "Closed Won", "Closed Lost"]
+STAGE_WEIGHTS = [0.6, 0.25, 0.15]
+PILLARS = ["Infrastructure", "Security", "Collaboration", "Data Center", "Cloud", "Services"]
+BRANDS = ["Cisco", "Fortinet", "Dell", "HPE", "Microsoft", "VMware", "Palo Alto", "Huawei", "Lenovo", "Oracle"]
+INDUSTRIES = ["Banking", "Government", "Telco", "Manufacturing", "Retail", "Energy", "Healthcare", "Education"]
+DISTRIBUTORS = ["Metrodata", "Ingram Micro", "Synnex", "Westcon", "ECS", "Direct"]
+SERVICES = ["Implementation", "Maintenance", "Managed Service", "Consulting", "None"]
+WORDS = ["Upgrade", "Refresh", "Migrasi", "Pengadaan", "Ekspansi", "Modernisasi", "Perpanjangan", "Integrasi"]
+
+N_SALES_GROUPS = 12
+SALES_PER_GROUP = 8
+N_PRESALES = 40
+LINES_PER_OPP_MAX = 8
+CHUNK_ROWS = 50_000
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        sales_name TEXT PRIMARY KEY,
+        password TEXT NOT NULL,
+        salesgroup TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS presales (
+        presales_name TEXT PRIMARY KEY,
+        email TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS opportunities (
+        uid TEXT PRIMARY KEY,
+        opportunity_id TEXT NOT NULL,
+        opportunity_name TEXT,
+        company_name TEXT,
+        vertical_industry TEXT,
+        sales_name TEXT,
+        salesgroup_id TEXT,
+        presales_name TEXT,
+        responsible_name TEXT,
+        distributor_name TEXT,
+        stage TEXT,
+        pillar TEXT,
+        solution TEXT,
+        service TEXT,
+        brand TEXT,
+        pillar_product TEXT,
+        solution_product TEXT,
+        product_id TEXT,
+        cost NUMERIC,
+        selling_price NUMERIC,
+        sales_notes TEXT,
+        start_date DATE,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS activity_logs_sales (
+        id BIGSERIAL PRIMARY KEY,
+        timestamp TIMESTAMP,
+        opportunity_id TEXT,
+        opportunity_name TEXT,
+        user_name TEXT,
+        action TEXT,
+        field_changed TEXT,
+        old_value TEXT,
+        new_value TEXT
+    )
+    """,
+]
+
+def _people():
+    groups = [f"SG{g:02d}" for g in range(1, N_SALES_GROUPS + 1)]
+    users = pd.DataFrame({
+        "sales_name": [f"Sales {g}-{i}" for g in groups for i in range(1, SALES_PER_GROUP + 1)],
+        "password": "bench",
+        "salesgroup": [g for g in groups for _ in range(SALES_PER_GROUP)],
+    })
+    presales = pd.DataFrame({
+        "presales_name": [f"Presales {i:02d}" for i in range(1, N_PRESALES + 1)],
+        "email": [f"presales{i:02d}@example.com" for i in range(1, N_PRESALES + 1)],
+    })
+    return users, presales
+
+def generate_opportunities(n_lines, users, presales, seed=42):
+    """DataFrame line item: 1..LINES_PER_OPP_MAX baris per opportunity, header sama per opportunity."""
+    rng = np.random.default_rng(seed)
+    lines = rng.integers(1, LINES_PER_OPP_MAX + 1, size=n_lines)
+    lines = lines[:np.searchsorted(np.cumsum(lines), n_lines) + 1]
+    lines[-1] -= lines.sum() - n_lines
+    n_opps = len(lines)
+
+    # Atribut level opportunity (header)
+    owner = rng.integers(0, len(users), size=n_opps)
+    n_companies = max(50, n_opps // 8)
+    company = rng.integers(0, n_companies, size=n_opps)
+    created = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 3 * 365 * 24 * 3600, size=n_opps), unit="s")
+    opp = pd.DataFrame({
+        "opportunity_id": [f"ENT{i:07d}" for i in range(n_opps)],
+        "opportunity_name": [
+            f"{WORDS[w]} {PILLARS[p]} {c}" for w, p, c in
+            zip(rng.integers(0, len(WORDS), n_opps), rng.integers(0, len(PILLARS), n_opps), company)
+        ],
+        "company_name": [f"PT Pelanggan {c:05d}" for c in company],
+        "vertical_industry": np.array(INDUSTRIES)[company % len(INDUSTRIES)],
+        "sales_name": users["sales_name"].to_numpy()[owner],
+        "salesgroup_id": users["salesgroup"].to_numpy()[owner],
+        "presales_name": presales["presales_name"].to_numpy()[rng.integers(0, len(presales), n_opps)],
+        "stage": rng.choice(STAGES, size=n_opps, p=STAGE_WEIGHTS),
+        "distributor_name": rng.choice(DISTRIBUTORS, size=n_opps),
+        "sales_notes": "",
+        "start_date": created.normalize(),
+        "created_at": created,
+    })
+    opp["responsible_name"] = opp["presales_name"]
+
+    # Expand ke level line item
+    df = opp.loc[opp.index.repeat(lines)].reset_index(drop=True)
+    n = len(df)
+    df.insert(0, "uid", [f"L{i:09d}" for i in range(n)])
+    pillar = rng.integers(0, len(PILLARS), size=n)
+    df["pillar"] = np.array(PILLARS)[pillar]
+    df["solution"] = [f"{PILLARS[p]} Solution {k}" for p, k in zip(pillar, rng.integers(1, 6, size=n))]
+    df["service"] = rng.choice(SERVICES, size=n)
+    df["brand"] = rng.choice(BRANDS, size=n)
+    df["pillar_product"] = df["pillar"]
+    df["solution_product"] = df["solution"]
+    df["product_id"] = [f"P{k:05d}" for k in rng.integers(0, 20_000, size=n)]
+    cost = np.round(rng.lognormal(mean=18, sigma=1.2, size=n), -3)
+    df["cost"] = cost
+    df["selling_price"] = np.round(cost * rng.uniform(1.05, 1.4, size=n), -3)
+    # Line item dibuat berurutan setelah header
+    df["created_at"] = df["created_at"] + pd.to_timedelta(df.groupby("opportunity_id").cumcount(), unit="s")
+    df["updated_at"] = df["created_at"]
+    return df
+
+def generate_activity_logs(opps, n_logs, seed=43):
+    rng = np.random.default_rng(seed)
+    pick = opps.iloc[rng.integers(0, len(opps), size=n_logs)]
+    return pd.DataFrame({
+        "timestamp": pick["created_at"].to_numpy() + pd.to_timedelta(rng.integers(0, 90 * 86400, size=n_logs), unit="s"),
+        "opportunity_id": pick["opportunity_id"].to_numpy(),
+        "opportunity_name": pick["opportunity_name"].to_numpy(),
+        "user_name": pick["sales_name"].to_numpy(),
+        "action": "UPDATE STAGE",
+        "field_changed": "stage",
+        "old_value": "Open",
+        "new_value": pick["stage"].to_numpy(),
+    })
+
+def _copy(connection, table, df):
+    """COPY per chunk (jauh lebih cepat dari INSERT untuk jutaan baris)."""
+    raw = connection.connection.dbapi_connection
+    columns = ", ".join(df.columns)
+    with raw.cursor() as cursor:
+        for start in range(0, len(df), CHUNK_ROWS):
+            buf = io.StringIO()
+            df.iloc[start:start + CHUNK_ROWS].to_csv(buf, index=False, header=False)
+            buf.seek(0)
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+
+def generate(engine, size, seed=42):
+    """Isi ulang database benchmark dengan `size` line item. Return jumlah baris per tabel."""
+    n_lines = SIZES[size] if size in SIZES else int(size)
+    users, presales = _people()
+    opps = generate_opportunities(n_lines, users, presales, seed=seed)
+    logs = generate_activity_logs(opps, max(1000, n_lines // 5), seed=seed + 1)
+
+    with engine.begin() as connection:
+        for statement in SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text("TRUNCATE users, presales, opportunities, activity_logs_sales"))
+
+        # Jika migrasi header sudah ada: matikan trigger selama COPY, header di-refresh sekali di akhir
+        has_headers = connection.execute(text("SELECT to_regclass('opportunity_headers') IS NOT NULL")).scalar()
+        if has_headers:
+            connection.execute(text("TRUNCATE opportunity_headers"))
+            connection.execute(text("ALTER TABLE opportunities DISABLE TRIGGER USER"))
+
+        _copy(connection, "users", users)
+        _copy(connection, "presales", presales)
+        _copy(connection, "opportunities", opps)
+        _copy(connection, "activity_logs_sales", logs)
+
+        if has_headers:
+            connection.execute(text("ALTER TABLE opportunities ENABLE TRIGGER USER"))
+            connection.execute(text(
+                "SELECT refresh_opportunity_headers(ARRAY(SELECT DISTINCT opportunity_id FROM opportunities))"
+            ))
+
+    migrations.apply_migrations(engine)
+    with engine.connect() as connection:
+        connection.execute(text("ANALYZE"))
+        connection.commit()
+    return {"users": len(users), "presales": len(presales), "opportunities": len(opps), "activity_logs_sales": len(logs)}
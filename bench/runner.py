@@ -0,0 +1,191 @@
+"""Menjalankan fungsi backend per scope otoritas dan mengukur latensi & memori puncak."""
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+from sqlalchemy import text
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+def _sample_scopes(engine):
+    """Satu scope nyata per level: TOP_MGMT, manager (satu sales group) & individu."""
+    with engine.connect() as connection:
+        row = connection.execute(text("""
+            SELECT salesgroup_id, sales_name, COUNT(*) AS n
+            FROM opportunities
+            GROUP BY salesgroup_id, sales_name
+            ORDER BY n DESC
+            LIMIT 1
+        """)).mappings().first()
+    sg, sn = row["salesgroup_id"], row["sales_name"]
+    return {
+        "TOP_MGMT": ("TOP_MGMT", sn, True),
+        "manager": (sg, sn, True),
+        "individu": (sg, sn, False),
+    }
+
+def _sample_opportunity(engine, sales_group, sales_name):
+    with engine.connect() as connection:
+        return connection.execute(text("""
+            SELECT opportunity_id, opportunity_name, stage
+            FROM opportunity_headers
+            WHERE salesgroup_id = :sg AND sales_name = :sn AND stage = 'Open'
+            LIMIT 1
+        """), {"sg": sales_group, "sn": sales_name}).mappings().first()
+
+def _rss_peak_mb():
+    """Puncak RSS proses sejauh ini (MB); ru_maxrss dalam KB di Linux, byte di macOS."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if platform.system() == "Darwin" else peak / 1024
+
+def _measure(fn, iterations, before=None):
+    """
+    Latensi tiap iterasi (ms), lalu satu iterasi tambahan di bawah tracemalloc untuk
+    memori Python puncak (MB); tracemalloc tidak aktif saat mengukur latensi.
+    Buffer Arrow tidak terlihat oleh tracemalloc, jadi dicatat juga: `arrow_mb` (alokasi
+    memory pool Arrow yang dipegang hasil iterasi itu & cache) dan `rss_peak_mb` (puncak
+    RSS proses sejauh ini, monoton naik sepanjang run).
+    """
+    timings = []
+    for i in range(iterations):
+        if before:
+            before()
+        start = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    if before:
+        before()
+    arrow_before = pa.total_allocated_bytes()
+    tracemalloc.start()
+    try:
+        result = fn(iterations)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    arrow_bytes = pa.total_allocated_bytes() - arrow_before  # selagi hasil masih dipegang
+    del result
+
+    arr = np.array(timings)
+    return {
+        "iterations": iterations,
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "p99_ms": round(float(np.percentile(arr, 99)), 2),
+        "max_ms": round(float(arr.max()), 2),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "arrow_mb": round(arrow_bytes / 1024 / 1024, 2),
+        "rss_peak_mb": round(_rss_peak_mb(), 2),
+    }
+
+def run(backend, size, iterations=20, warm=True):
+    """
+    Ukur fungsi baca (cold: cache Streamlit dikosongkan tiap iterasi; warm: dari cache)
+    untuk tiap scope, lalu fungsi tulis pada satu opportunity milik scope individu.
+    """
+    import streamlit as st
+
+    engine = backend.conn.engine
+    scopes = _sample_scopes(engine)
+
+    def clear_caches():
+        st.cache_data.clear()
+        backend._kanban_frame.clear()
+        backend._dashboard_snapshot.clear()
+
+    reads = {
+        "get_kanban_data": lambda sc: (lambda i: backend.get_kanban_data(*sc)),
+        "get_dashboard_data": lambda sc: (lambda i: backend.get_dashboard_data(*sc)),
+        "search_opportunities": lambda sc: (
+            lambda i: backend.search_opportunities(["upgrade", "pelanggan 01", "migrasi cloud"][i % 3], "Opportunity Name", *sc)
+        ),
+    }
+
+    results = []
+    for scope_label, scope in scopes.items():
+        for name, make in reads.items():
+            modes = [("cold", clear_caches)] + ([("warm", None)] if warm else [])
+            for mode, before in modes:
+                stats = _measure(make(scope), iterations, before=before)
+                results.append({"function": name, "scope": scope_label, "mode": mode, **stats})
+                print(f"{name:<32} {scope_label:<9} {mode:<5} p50={stats['p50_ms']:>9.2f}ms "
+                      f"p95={stats['p95_ms']:>9.2f}ms peak={stats['peak_mb']:>8.2f}MB "
+              f"arrow={stats['arrow_mb']:>8.2f}MB rss={stats['rss_peak_mb']:>8.2f}MB")
+
+    # Fungsi tulis: harga item dan stage bolak-balik agar setiap iterasi benar-benar mengubah data
+    sg, sn, _ = scopes["individu"]
+    opp = _sample_opportunity(engine, sg, sn)
+    items = backend.get_opportunity_line_items(opp["opportunity_id"])
+
+    def update_prices(i):
+        updates = [{"uid": uid, "selling_price": float(price or 0) + (1 if i % 2 == 0 else -1)}
+                   for uid, price in zip(items["uid"], items["selling_price"])]
+        header = backend.get_sales_opportunity_header(opp["opportunity_id"])
+        res = backend.update_line_item_prices(updates, sn, opp["opportunity_id"], opp["opportunity_name"], header["updated_at"])
+        assert res["status"] == 200, res["message"]
+
+    def update_stage(i):
+        stage = "Closed Won" if i % 2 == 0 else "Open"
+        # Token versi dibaca seperti UI: header terbaru sebelum menyimpan
+        header = backend.get_sales_opportunity_header(opp["opportunity_id"])
+        res = backend.update_stage_with_notification(opp["opportunity_id"], stage, "bench", sn, header["updated_at"])
+        assert res["status"] == 200, res["message"]
+
+    for name, fn in [("update_line_item_prices", update_prices), ("update_stage_with_notification", update_stage)]:
+        stats = _measure(fn, iterations)
+        results.append({"function": name, "scope": "individu", "mode": "write", **stats})
+        print(f"{name:<32} {'individu':<9} {'write':<5} p50={stats['p50_ms']:>9.2f}ms "
+              f"p95={stats['p95_ms']:>9.2f}ms peak={stats['peak_mb']:>8.2f}MB "
+              f"arrow={stats['arrow_mb']:>8.2f}MB rss={stats['rss_peak_mb']:>8.2f}MB")
+
+    # Kembalikan stage awal opportunity sampel
+    header = backend.get_sales_opportunity_header(opp["opportunity_id"])
+    backend.update_stage_with_notification(opp["opportunity_id"], opp["stage"], "bench", sn, header["updated_at"])
+
+    return {
+        "commit": _git_commit(),
+        "size": size,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "results": results,
+    }
+
+def save(report):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, f"{report['commit']}-{report['size']}-{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+def compare(path_a, path_b, metric="p50_ms"):
+    """Tabel perbandingan dua hasil: nilai A, nilai B dan rasio B/A per fungsi/scope/mode."""
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+
+    key = lambda r: (r["function"], r["scope"], r["mode"])
+    base = {key(r): r for r in a["results"]}
+    print(f"{metric}: {a['commit']} ({a['size']}) -> {b['commit']} ({b['size']})")
+    for r in b["results"]:
+        old = base.get(key(r))
+        if old is None or metric not in old:
+            continue  # hasil lama belum punya metrik ini (mis. arrow_mb)
+        ratio = r[metric] / old[metric] if old[metric] else float("inf")
+        flag = "🔺" if ratio > 1.1 else ("🟢" if ratio < 0.9 else "  ")
+        print(f"{flag} {r['function']:<32} {r['scope']:<9} {r['mode']:<5} "
+              f"{old[metric]:>10.2f} {r[metric]:>10.2f}  x{ratio:.2f}")
@@ -0,0 +1,363 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import backend as db
+import loader
+
+# ==============================================================================
+# PREPROCESSING DATASET DASHBOARD (SEKALI PER VERSI DATA)
+# ==============================================================================
+
+# Kolom slicer pada Filter Panel (urutan mengikuti layout di tab2_dashboard)
+SLICER_COLUMNS = db.DASHBOARD_SLICER_COLUMNS
+
+def slicer_codes(column):
+    """
+    Kode kategori per baris (int32) + label tersortir untuk satu kolom slicer Arrow.
+    NULL -> "Unknown"; kode = peringkat label, jadi sort per kode = sort per label.
+    Hanya array kode yang dialokasikan; nilai kolom tetap di tabel (bersama).
+    """
+    encoded = pc.dictionary_encode(column)
+    if encoded.num_chunks == 0:
+        return np.empty(0, dtype=np.int32), pd.Index([], dtype=object)
+    # dictionary_encode pada ChunkedArray memakai satu dictionary untuk semua chunk
+    labels = [str(v) for v in encoded.chunk(0).dictionary.to_pylist()]
+    indices = pa.chunked_array([chunk.indices for chunk in encoded.chunks])
+    codes = indices.fill_null(len(labels)).to_numpy().astype(np.int32)
+    labels.append("Unknown")
+
+    categories = pd.Index(sorted(set(labels)), dtype=object)
+    rank = categories.get_indexer(labels).astype(np.int32)
+    return rank[codes], categories
+
+def filter_dates(table):
+    """Tanggal filter per baris (datetime64[D], NaT = tanpa tanggal); prioritas start_date -> created_at."""
+    source = db.dashboard_date_column(table.column_names)
+    if source is None:
+        return None
+    column = table[source]
+    if pa.types.is_timestamp(column.type):
+        if column.type.tz is not None:
+            column = pc.local_timestamp(column)  # jam lokal dipertahankan, cukup untuk filter per tanggal
+        column = pc.cast(column, pa.date32())
+    if pa.types.is_date(column.type):
+        return column.to_numpy().astype('datetime64[D]')
+    dates = pd.to_datetime(column.to_pandas(), errors='coerce')
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.to_numpy().astype('datetime64[D]')
+
+# ==============================================================================
+# INDEKS SLICER (POSTING LIST PER NILAI + INDEKS TANGGAL TERSORTIR)
+# ==============================================================================
+
+class SlicerIndex:
+    """
+    Indeks untuk filter engine: per kolom slicer, row-id dikelompokkan per kode kategori
+    (posting list tersortir), plus row-id yang diurutkan berdasarkan tanggal.
+    Kombinasi filter di-resolve menjadi himpunan row-id tanpa membuat tabel antara.
+    Baris `hidden` (sudah digantikan baris delta) tidak masuk indeks mana pun.
+    """
+
+    def __init__(self, n_rows, codes, categories, dates=None, hidden=None):
+        self.n_rows = n_rows
+        self.categories = categories
+        self.codes = {}
+        self._order = {}
+        self._offsets = {}
+
+        live = None
+        self.live_rows = None  # None = semua baris hidup
+        if hidden is not None and len(hidden):
+            live = np.ones(n_rows, dtype=bool)
+            live[hidden] = False
+            self.live_rows = np.flatnonzero(live)
+
+        for col, col_codes in codes.items():
+            if live is not None:
+                col_codes = np.where(live, col_codes, -1).astype(np.int32)  # -1 = tidak diindeks
+            n_cats = len(categories[col])
+            counts = np.bincount(col_codes[col_codes >= 0], minlength=n_cats)
+            self.codes[col] = col_codes
+            # argsort stabil: row-id tiap kode tetap urut naik; kode -1 (hidden) di depan, dilewati
+            order = np.argsort(col_codes, kind='stable').astype(np.int64)
+            self._order[col] = order[n_rows - counts.sum():]
+            self._offsets[col] = np.concatenate(([0], np.cumsum(counts)))
+
+        self._date_rows = self._date_values = None
+        if dates is not None:
+            valid = ~np.isnat(dates)
+            if live is not None:
+                valid &= live
+            valid_rows = np.flatnonzero(valid)
+            order = np.argsort(dates[valid_rows], kind='stable')
+            self._date_rows = valid_rows[order]
+            self._date_values = dates[valid_rows][order]
+
+    def rows_for(self, col, values):
+        """Row-id tersortir untuk baris dengan `col` bernilai salah satu dari `values`."""
+        codes = self.categories[col].get_indexer(list(values))
+        order, offsets = self._order[col], self._offsets[col]
+        parts = [order[offsets[c]:offsets[c + 1]] for c in codes if c >= 0]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+
+    def rows_in_date_range(self, start_d, end_d):
+        """Row-id tersortir dengan tanggal di [start_d, end_d] (inklusif, baris tanpa tanggal dibuang)."""
+        lo = np.searchsorted(self._date_values, np.datetime64(start_d, 'D'), side='left')
+        hi = np.searchsorted(self._date_values, np.datetime64(end_d, 'D'), side='right')
+        if lo == 0 and hi == self.n_rows:
+            return None  # semua baris lolos
+        return np.sort(self._date_rows[lo:hi])
+
+    def mask_for(self, col, values):
+        """Bitmap (bool per baris) untuk `col` bernilai salah satu dari `values`."""
+        # Slot terakhir (kode -1 = baris hidden) selalu False
+        lookup = np.zeros(len(self.categories[col]) + 1, dtype=bool)
+        codes = self.categories[col].get_indexer(list(values))
+        lookup[codes[codes >= 0]] = True
+        return lookup[self.codes[col]]
+
+    def option_counts(self, selections, date_range=None):
+        """
+        Jumlah baris per nilai untuk setiap kolom slicer, dihitung dengan semua filter
+        aktif KECUALI filter kolom itu sendiri (cross-filter / cascading).
+        Return dict kolom -> array count sejajar dengan `categories[col]`.
+        """
+        active_cols, masks = [], []
+        for col, values in selections.items():
+            if values and col in self.categories:
+                active_cols.append(col)
+                masks.append(self.mask_for(col, values))
+        if date_range is not None and self._date_values is not None:
+            date_rows = self.rows_in_date_range(*date_range)
+            if date_rows is not None:
+                date_mask = np.zeros(self.n_rows, dtype=bool)
+                date_mask[date_rows] = True
+                active_cols.append(None)
+                masks.append(date_mask)
+
+        def combine(a, b):
+            if a is None: return b
+            if b is None: return a
+            return a & b
+
+        # prefix[i] = AND masks[:i], suffix[i] = AND masks[i:] (None = semua baris)
+        k = len(masks)
+        prefix, suffix = [None] * (k + 1), [None] * (k + 1)
+        for i in range(k):
+            prefix[i + 1] = combine(prefix[i], masks[i])
+        for i in range(k - 1, -1, -1):
+            suffix[i] = combine(masks[i], suffix[i + 1])
+
+        counts = {}
+        for col, codes in self.codes.items():
+            if col in active_cols:
+                i = active_cols.index(col)
+                mask = combine(prefix[i], suffix[i + 1])
+            else:
+                mask = prefix[k]
+
+            if mask is None:
+                counts[col] = np.diff(self._offsets[col])
+            else:
+                counts[col] = np.bincount(codes[mask], minlength=len(self.categories[col]))
+        return counts
+
+    def resolve(self, selections, date_range=None):
+        """
+        Interseksi semua filter aktif. Return array row-id tersortir,
+        atau None jika tidak ada filter yang membatasi (semua baris, tanpa baris hidden).
+        """
+        row_sets = [
+            self.rows_for(col, values)
+            for col, values in selections.items()
+            if values and col in self.categories
+        ]
+        if date_range is not None and self._date_values is not None:
+            date_rows = self.rows_in_date_range(*date_range)
+            if date_rows is not None:
+                row_sets.append(date_rows)
+
+        if not row_sets:
+            return self.live_rows
+
+        # Mulai dari himpunan terkecil agar interseksi berikutnya murah
+        row_sets.sort(key=len)
+        rows = row_sets[0]
+        for other in row_sets[1:]:
+            if rows.size == 0:
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+# ==============================================================================
+# PAGING TABEL DETAIL (IN-MEMORY)
+# ==============================================================================
+
+def _sort_keys(series):
+    """Kunci sort numerik; categorical diurutkan berdasarkan label (bukan urutan kategori)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        labels = series.cat.categories.astype(str)
+        rank = np.empty(len(labels), dtype='float64')
+        rank[np.argsort(labels, kind='stable')] = np.arange(len(labels))
+        codes = series.cat.codes.to_numpy()
+        return pd.Series(np.where(codes >= 0, rank[codes], np.nan))
+    return pd.Series(series.to_numpy())
+
+def sorted_page(df, sort_by, descending=False, offset=0, limit=50, columns=None):
+    """
+    Satu halaman `df` terurut berdasarkan `sort_by` (NULL di akhir, urutan stabil).
+    Hanya posisi baris yang diurutkan; yang di-materialisasi cuma baris halaman itu.
+    """
+    if sort_by in df.columns and len(df) > 1:
+        order = _sort_keys(df[sort_by]).sort_values(ascending=not descending, kind='stable', na_position='last')
+        positions = order.index[offset:offset + limit]
+    else:
+        positions = np.arange(offset, min(offset + limit, len(df)))
+    page = df.take(positions)
+    return page[[c for c in columns if c in page.columns]] if columns else page
+
+class DashboardFrame:
+    """
+    Dataset dashboard siap pakai di atas tabel Arrow (snapshot bersama + delta):
+    kode slicer & indeks milik proses, kolom data tidak pernah disalin ke pandas.
+    """
+    pushdown = False
+
+    def __init__(self, table, hidden=None):
+        self.table = table
+        self.hidden = hidden
+        self.table_columns = [c for c in db.DASHBOARD_TABLE_COLUMNS if c in table.column_names]
+
+        codes, categories = {}, {}
+        for col in SLICER_COLUMNS:
+            if col in table.column_names:
+                codes[col], categories[col] = slicer_codes(table[col])
+        dates = filter_dates(table)
+        self.index = SlicerIndex(table.num_rows, codes, categories, dates, hidden)
+
+        live_rows = self.index.live_rows
+        self.n_live = table.num_rows if live_rows is None else len(live_rows)
+        self.empty = self.n_live == 0
+
+        self.date_min = self.date_max = None
+        if self.index._date_values is not None and len(self.index._date_values):
+            self.date_min = self.index._date_values[0].astype(object)
+            self.date_max = self.index._date_values[-1].astype(object)
+
+    def cascading_options(self, selections, date_range=None):
+        """
+        Opsi slicer yang masih bisa menghasilkan data berdasarkan pilihan slicer lain.
+        Return dict kolom -> (list opsi, dict opsi -> jumlah baris). Nilai yang sedang
+        dipilih selalu ikut dalam opsi walau jumlahnya 0.
+        """
+        result = {}
+        for col, col_counts in self.index.option_counts(selections, date_range).items():
+            cats = self.index.categories[col]
+            keep = col_counts > 0
+            selected = cats.get_indexer(list(selections.get(col) or []))
+            keep[selected[selected >= 0]] = True
+            opts = cats[keep].tolist()
+            result[col] = (opts, dict(zip(opts, col_counts[keep].tolist())))
+        return result
+
+    def _column(self, col, rows):
+        column = self.table[col]
+        return column if rows is None else column.take(pa.array(rows))
+
+    def query(self, selections, date_range=None):
+        """Summary metrik untuk kombinasi filter; baris detail diambil per halaman lewat `page`."""
+        rows = self.index.resolve(selections, date_range)
+        names = self.table.column_names
+
+        customers = 0
+        if 'company_name' in self.index.codes:
+            codes = self.index.codes['company_name']
+            picked = codes[codes >= 0] if rows is None else codes[rows]
+            customers = int(np.count_nonzero(np.bincount(picked, minlength=len(self.index.categories['company_name']))))
+        elif 'company_name' in names:
+            customers = pc.count_distinct(self._column('company_name', rows)).as_py()
+
+        return {
+            "rows": self.n_live if rows is None else len(rows),
+            "unique_opportunities": pc.count_distinct(self._column('opportunity_id', rows)).as_py() if 'opportunity_id' in names else 0,
+            "unique_customers": customers,
+            "total_value": (pc.sum(self._column('selling_price', rows)).as_py() or 0) if 'selling_price' in names else 0,
+        }
+
+    def page(self, selections, date_range, sort_by, descending=False, offset=0, limit=50):
+        """
+        Satu halaman tabel detail terurut `sort_by` (NULL di akhir, urutan stabil). Yang diurutkan
+        hanya posisi baris hasil filter; yang dikonversi ke pandas cuma baris halaman itu.
+        """
+        rows = self.index.resolve(selections, date_range)
+        if rows is None:
+            rows = np.arange(self.table.num_rows)
+
+        if sort_by in self.index.codes:
+            keys = self.index.codes[sort_by][rows]  # kode = peringkat label
+            order = np.argsort(-keys if descending else keys, kind='stable')
+        elif sort_by in self.table.column_names and len(rows) > 1:
+            order = pc.array_sort_indices(
+                self._column(sort_by, rows), order='descending' if descending else 'ascending',
+                null_placement='at_end'
+            ).to_numpy()
+        else:
+            order = np.arange(len(rows))
+
+        page_rows = rows[order[offset:offset + limit]]
+        df = self.table.select(self.table_columns).take(pa.array(page_rows)).to_pandas()
+        # Harga kosong ditampilkan 0, sama dengan metrik
+        for col in loader.MONEY_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].fillna(0)
+        return df
+
+class PushdownSource:
+    """
+    Sumber data dashboard untuk scope besar: opsi slicer, filter, proyeksi kolom,
+    dan metrik ringkasan dieksekusi di PostgreSQL (tidak memuat seluruh dataset).
+    Interface sama dengan DashboardFrame (cascading_options & query), ditambah `page`
+    untuk tabel detail (sort & paging di SQL).
+    """
+    pushdown = True
+
+    def __init__(self, sales_group, sales_name, is_super_user, stats):
+        self.scope = (sales_group, sales_name, is_super_user)
+        self.table_columns = [c for c in db.DASHBOARD_TABLE_COLUMNS if c in db.get_opportunity_columns()]
+        self.empty = stats["rows"] == 0
+        self.date_min = stats["date_min"]
+        self.date_max = stats["date_max"]
+
+    def cascading_options(self, selections, date_range=None):
+        return db.get_dashboard_option_counts(*self.scope, selections=selections, date_range=date_range)
+
+    def query(self, selections, date_range=None):
+        """Hanya ringkasan; baris detail diambil per halaman lewat `page`."""
+        return db.get_dashboard_summary(*self.scope, selections=selections, date_range=date_range)
+
+    def page(self, selections, date_range, sort_by, descending=False, offset=0, limit=50):
+        return db.get_dashboard_page(*self.scope, selections=selections, date_range=date_range,
+                                     sort_by=sort_by, descending=descending, offset=offset, limit=limit)
+
+def get_dashboard_source(sales_group, sales_name, is_super_user=False):
+    """Pilih mode berdasarkan jumlah baris scope: in-memory (DashboardFrame) atau push-down."""
+    stats = db.get_dashboard_scope_stats(sales_group, sales_name, is_super_user)
+    if stats["rows"] > db.PUSHDOWN_ROW_THRESHOLD:
+        return PushdownSource(sales_group, sales_name, is_super_user, stats)
+    return get_dashboard_frame(sales_group, sales_name, is_super_user)
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _prepared_frame(scope, version_key, _table, _hidden):
+    # `_table`/`_hidden` tidak di-hash; key cache cukup (scope, (identitas base, versi delta))
+    return DashboardFrame(_table, _hidden)
+
+def get_dashboard_frame(sales_group, sales_name, is_super_user=False):
+    """DashboardFrame untuk scope user, dihitung ulang hanya saat versi data berubah."""
+    snapshot = db.get_dashboard_snapshot(sales_group, sales_name, is_super_user)
+    table, hidden, version_key = snapshot.current()
+    return _prepared_frame(snapshot.scope, version_key, table, hidden)
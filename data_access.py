@@ -0,0 +1,111 @@
+"""
+Lapisan akses data per session di atas backend.py.
+
+Dalam satu interaksi, setiap dataset logis diambil paling banyak sekali:
+- `read(fn, *args)` memo hasil fungsi baca backend per session (key: fungsi, argumen &
+  generasi cache backend, sehingga write langsung membuat memo usang); memo dikosongkan
+  di awal setiap full run (`begin_run`) dan dipakai ulang oleh rerun fragment.
+- Jika prefetch untuk key yang sama sedang berjalan, hasil prefetch ditunggu alih-alih
+  mengirim query kedua.
+- Header & detail opportunity diturunkan dari frame yang sudah dimuat (kartu/daftar
+  Kanban, line item) sebelum jatuh ke query terpisah.
+"""
+import threading
+
+import pandas as pd
+import streamlit as st
+
+import backend as db
+
+HEADER_COLUMNS = [
+    'opportunity_id', 'opportunity_name', 'company_name',
+    'sales_name', 'presales_name', 'stage', 'selling_price', 'sales_notes', 'updated_at'
+]
+DETAIL_COLUMNS = ['pillar', 'solution', 'service', 'brand', 'selling_price']
+
+# Fungsi backend yang hasilnya berisi baris header (dipakai untuk menurunkan header)
+_HEADER_SOURCES = ("get_kanban_data", "get_kanban_page")
+
+class _SessionMemo:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = {}
+
+def _memo():
+    if "_data_access" not in st.session_state:
+        st.session_state._data_access = _SessionMemo()
+    return st.session_state._data_access
+
+def _key(fn, args, kwargs):
+    return (fn.__name__, args, tuple(sorted(kwargs.items())))
+
+def begin_run():
+    """Dipanggil sekali di awal setiap full run."""
+    memo = _memo()
+    with memo.lock:
+        memo.results.clear()
+
+def read(fn, *args, memoize=True, **kwargs):
+    """
+    Panggil fungsi baca backend paling banyak sekali per key dalam interaksi ini.
+    `memoize=False` hanya menggabungkan dengan prefetch yang sedang berjalan (untuk data
+    yang punya sinkronisasi sendiri, mis. snapshot dashboard).
+    """
+    memo = _memo()
+    key = _key(fn, args, kwargs)
+    generation = db.cache_generation()
+    if memoize:
+        with memo.lock:
+            hit = memo.results.get(key)
+        if hit is not None and hit[0] == generation:
+            return hit[1]
+
+    result = None
+    future = db.prefetch_inflight(key)
+    # Prefetch yang belum mulai (masih antri) dibatalkan & dijalankan langsung di sini;
+    # entry inflight-nya dibersihkan oleh done callback di backend.prefetch
+    if future is not None and not future.cancel():
+        result = future.result()
+    if result is None:
+        result = fn(*args, **kwargs)
+
+    if memoize:
+        with memo.lock:
+            memo.results[key] = (generation, result)
+    return result
+
+def prefetch(fn, *args, **kwargs):
+    """Jadwalkan `fn` di background dengan key yang sama seperti `read`."""
+    return db.prefetch(_key(fn, args, kwargs), fn, *args, **kwargs)
+
+def _loaded_frames(names):
+    memo = _memo()
+    generation = db.cache_generation()
+    with memo.lock:
+        entries = list(memo.results.items())
+    for (name, _, _), (gen, result) in entries:
+        if name in names and gen == generation:
+            yield result[0] if isinstance(result, tuple) else result
+
+def opportunity_header(opp_id, fresh=False):
+    """
+    Header opportunity dari frame Kanban yang sudah dimuat; query hanya jika belum ada.
+    `fresh=True` (editor harga) selalu membaca database: frame Kanban bisa tertinggal dari
+    write di proses lain selama TTL cache.
+    """
+    if fresh:
+        return read(db.get_sales_opportunity_header, opp_id)
+    for df in _loaded_frames(_HEADER_SOURCES):
+        if isinstance(df, pd.DataFrame) and not df.empty and set(HEADER_COLUMNS) <= set(df.columns):
+            match = df[df['opportunity_id'] == opp_id]
+            if not match.empty:
+                return match.iloc[0][HEADER_COLUMNS].to_dict()
+    return read(db.get_sales_opportunity_header, opp_id)
+
+def opportunity_line_items(opp_id):
+    return read(db.get_opportunity_line_items, opp_id)
+
+def opportunity_details(opp_id):
+    """Detail item diturunkan dari line item (satu query untuk detail & editor harga)."""
+    df_items = opportunity_line_items(opp_id)
+    return df_items[[c for c in DETAIL_COLUMNS if c in df_items.columns]].copy()
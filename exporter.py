@@ -0,0 +1,100 @@
+"""
+Export seleksi dashboard ke CSV / Parquet secara streaming.
+
+Baris dibaca per chunk dari backend.stream_dashboard_rows (server-side cursor) dan langsung
+ditulis ke file sementara; saat menulis paling banyak satu chunk yang ada di memori.
+
+Download TIDAK streaming: st.download_button butuh isi file sebagai bytes (take) dan media
+manager Streamlit menyimpan salinannya, jadi puncak memori ~2x ukuran file. Karena itu
+export dibatasi keras: EXPORT_MAX_ROWS baris dan EXPORT_MAX_BYTES byte per file. Seleksi
+yang lebih besar ditolak (ValueError); persempit filter atau ambil langsung dari database.
+"""
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import backend as db
+
+FORMATS = {"CSV": ".csv", "Parquet": ".parquet"}
+EXPORT_MAX_ROWS = 100000
+EXPORT_MAX_BYTES = 64 * 1024 * 1024
+
+def _parquet_schema(chunk):
+    """Schema dari chunk pertama; kolom yang seluruhnya NULL dianggap string."""
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    fields = [pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in schema]
+    return pa.schema(fields)
+
+def _capped(chunks, max_rows):
+    """Teruskan chunk selama total baris <= max_rows; lebih dari itu export dihentikan."""
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        if rows > max_rows:
+            raise ValueError(f"Export dibatasi {max_rows} baris; persempit filter dashboard.")
+        yield chunk
+
+def write_csv(chunks, path):
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, index=False, header=(i == 0))
+            rows += len(chunk)
+    return rows
+
+def write_parquet(chunks, path):
+    rows = 0
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = _parquet_schema(chunk)
+                writer = pq.ParquetWriter(path, schema, compression="zstd")
+            # Satu row group per chunk
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False, safe=False))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pq.write_table(pa.table({}), path)  # seleksi kosong: file Parquet valid tanpa baris
+    return rows
+
+def export_dashboard(fmt, sales_group, sales_name, is_super_user=False, selections=None, date_range=None):
+    """
+    Tulis seleksi dashboard ke file sementara. Return (path, jumlah baris).
+    Pemanggil bertanggung jawab menghapus file (lihat `take` / `remove`).
+    ValueError jika seleksi melebihi EXPORT_MAX_ROWS (file sementara sudah dihapus).
+    """
+    fd, path = tempfile.mkstemp(prefix="sales_export_", suffix=FORMATS[fmt])
+    os.close(fd)
+    chunks = _capped(db.stream_dashboard_rows(sales_group, sales_name, is_super_user, selections, date_range), EXPORT_MAX_ROWS)
+    try:
+        rows = write_parquet(chunks, path) if fmt == "Parquet" else write_csv(chunks, path)
+    except Exception:
+        remove(path)
+        raise
+    return path, rows
+
+def take(path, max_bytes=EXPORT_MAX_BYTES):
+    """
+    Isi file export (bytes) lalu hapus file-nya; file sementara tidak bertahan antar rerun.
+    ValueError jika file lebih besar dari max_bytes (isi tidak dibaca ke memori).
+    """
+    try:
+        size = os.path.getsize(path)
+        if size > max_bytes:
+            raise ValueError(f"File export {size // (1024 * 1024)} MB melebihi batas {max_bytes // (1024 * 1024)} MB; persempit filter dashboard.")
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        remove(path)
+
+def remove(path):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        print(f"⚠️ Gagal menghapus file export {path}: {e}")
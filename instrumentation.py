@@ -0,0 +1,245 @@
+"""
+Instrumentasi backend: durasi, jumlah baris, cache hit/miss per fungsi & slow-query log.
+
+- `install(engine)` memasang listener SQLAlchemy yang mengukur setiap statement SQL.
+- `@timed()` / `@timed("write")` membungkus fungsi backend; statement yang dieksekusi
+  selama fungsi berjalan diatribusikan ke fungsi tersebut (dan ke pemanggilnya).
+  Fungsi baca yang selesai tanpa satu pun statement dihitung sebagai cache hit.
+
+Statistik disimpan per proses (dibagi semua session) dan ditampilkan di view Diagnostics.
+Ambang slow query dari secrets.toml (dibaca sekali saat `install`):
+
+    [diagnostics]
+    slow_query_ms = 500
+"""
+import functools
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import event
+
+# Batas atas bucket histogram (ms); bucket terakhir = tak hingga
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+DEFAULT_SLOW_QUERY_MS = 500
+SLOW_LOG_SIZE = 200
+RECENT_DURATIONS = 1000  # sampel durasi terakhir per fungsi (untuk persentil)
+
+_lock = threading.Lock()
+_functions = {}
+_slow_log = deque(maxlen=SLOW_LOG_SIZE)
+_call_stack = ContextVar("instrumentation_call_stack", default=())
+_slow_query_ms = DEFAULT_SLOW_QUERY_MS
+
+def _configured_slow_query_ms():
+    try:
+        import streamlit as st
+        return float(st.secrets.get("diagnostics", {}).get("slow_query_ms", DEFAULT_SLOW_QUERY_MS))
+    except Exception:
+        return DEFAULT_SLOW_QUERY_MS
+
+def slow_query_ms():
+    """Ambang slow query yang berlaku (ms)."""
+    return _slow_query_ms
+
+class _Call:
+    """Satu pemanggilan fungsi backend yang sedang berjalan."""
+    __slots__ = ("name", "statements", "sql_ms", "sql_rows")
+
+    def __init__(self, name):
+        self.name = name
+        self.statements = 0
+        self.sql_ms = 0.0
+        self.sql_rows = 0
+
+def _new_stats(kind):
+    return {
+        "kind": kind, "calls": 0, "errors": 0, "cache_hits": 0, "cache_misses": 0,
+        "total_ms": 0.0, "max_ms": 0.0, "sql_ms": 0.0, "statements": 0, "rows": 0,
+        "histogram": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1),
+        "recent": deque(maxlen=RECENT_DURATIONS),
+    }
+
+def _bucket(ms):
+    for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+        if ms <= bound:
+            return i
+    return len(HISTOGRAM_BUCKETS_MS)
+
+def _count_rows(result):
+    """Jumlah baris dari hasil fungsi backend (DataFrame, tabel Arrow, (DataFrame, ...), list)."""
+    if isinstance(result, tuple) and result:
+        result = result[1] if isinstance(result[1], pd.DataFrame) else result[0]
+    result = getattr(result, "num_rows", result)  # pa.Table / DashboardSnapshot
+    if isinstance(result, int):
+        return result
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, (list, dict)):
+        return len(result)
+    return 0
+
+def _record(call, kind, elapsed_ms, rows, failed):
+    with _lock:
+        stats = _functions.setdefault(call.name, _new_stats(kind))
+        stats["calls"] += 1
+        stats["errors"] += int(failed)
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["sql_ms"] += call.sql_ms
+        stats["statements"] += call.statements
+        stats["rows"] += rows
+        stats["histogram"][_bucket(elapsed_ms)] += 1
+        stats["recent"].append(elapsed_ms)
+        if kind == "read":
+            if call.statements:
+                stats["cache_misses"] += 1
+            else:
+                stats["cache_hits"] += 1
+
+def timed(kind="read"):
+    """Decorator instrumentasi untuk fungsi backend ("read" atau "write")."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            call = _Call(fn.__name__)
+            token = _call_stack.set(_call_stack.get() + (call,))
+            start = time.perf_counter()
+            failed = False
+            result = None
+            try:
+                result = fn(*args, **kwargs)
+                # Fungsi tulis mengembalikan dict status, bukan exception
+                if kind == "write" and isinstance(result, dict) and result.get("status", 200) >= 400:
+                    failed = True
+                return result
+            except Exception:
+                failed = True
+                raise
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                _call_stack.reset(token)
+                rows = _count_rows(result) if kind == "read" else call.sql_rows
+                _record(call, kind, elapsed_ms, rows, failed)
+        return wrapper
+    return decorator
+
+# ==============================================================================
+# LISTENER SQLALCHEMY
+# ==============================================================================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("instrumentation_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["instrumentation_start"].pop()) * 1000
+    rows = max(cursor.rowcount or 0, 0)
+    stack = _call_stack.get()
+    for call in stack:
+        call.statements += 1
+        call.sql_ms += elapsed_ms
+        call.sql_rows += rows
+
+    if elapsed_ms >= _slow_query_ms:
+        caller = stack[-1].name if stack else "?"
+        entry = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "function": caller,
+            "duration_ms": round(elapsed_ms, 1),
+            "rows": rows,
+            "statement": " ".join(statement.split()),
+        }
+        with _lock:
+            _slow_log.append(entry)
+        print(f"🐢 Slow query {elapsed_ms:.0f}ms di {caller}: {entry['statement'][:300]}")
+
+def _handle_error(context):
+    # Statement gagal tidak memicu after_cursor_execute: buang waktu mulainya
+    if context.connection is not None:
+        context.connection.info.pop("instrumentation_start", None)
+
+def install(engine):
+    """
+    Pasang listener timing pada engine (idempoten). Ambang slow query dibaca di sini,
+    tidak dari st.secrets pada setiap statement.
+    """
+    global _slow_query_ms
+    _slow_query_ms = _configured_slow_query_ms()
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+    return engine
+
+# ==============================================================================
+# RINGKASAN UNTUK VIEW DIAGNOSTICS
+# ==============================================================================
+
+def summary():
+    """DataFrame satu baris per fungsi: jumlah panggilan, persentil durasi, SQL & cache."""
+    rows = []
+    with _lock:
+        for name, s in _functions.items():
+            recent = pd.Series(list(s["recent"]), dtype=float)
+            lookups = s["cache_hits"] + s["cache_misses"]
+            rows.append({
+                "function": name,
+                "kind": s["kind"],
+                "calls": s["calls"],
+                "errors": s["errors"],
+                "p50_ms": round(recent.quantile(0.5), 1) if len(recent) else 0.0,
+                "p95_ms": round(recent.quantile(0.95), 1) if len(recent) else 0.0,
+                "max_ms": round(s["max_ms"], 1),
+                "avg_sql_ms": round(s["sql_ms"] / s["calls"], 1) if s["calls"] else 0.0,
+                "statements": s["statements"],
+                "rows": s["rows"],
+                "cache_hit_rate": round(s["cache_hits"] / lookups, 3) if lookups else None,
+            })
+    df = pd.DataFrame(rows)
+    if not df.empty:
+        df = df.sort_values("p95_ms", ascending=False, ignore_index=True)
+    return df
+
+def histogram(function_name):
+    """Jumlah panggilan per bucket durasi untuk satu fungsi (index = label bucket)."""
+    labels = [f"≤{b}ms" for b in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+    with _lock:
+        counts = list(_functions.get(function_name, {}).get("histogram", [0] * len(labels)))
+    return pd.Series(counts, index=labels, name="calls")
+
+def slow_queries():
+    with _lock:
+        return pd.DataFrame(list(_slow_log))
+
+def reset():
+    with _lock:
+        _functions.clear()
+        _slow_log.clear()
+
+# ==============================================================================
+# MEMORI DATASET PER SCOPE
+# ==============================================================================
+
+_datasets = {}
+
+def record_dataset(name, scope, stats):
+    """Catat ukuran dataset yang dimuat (rows, bytes, ...) per jenis & scope."""
+    with _lock:
+        _datasets[(name, tuple(scope))] = {
+            "dataset": name,
+            "scope": " / ".join(str(s) for s in scope if s is not None),
+            "at": datetime.now().isoformat(timespec="seconds"),
+            **stats,
+        }
+
+def datasets():
+    """DataFrame dataset yang sedang/pernah dimuat, terbesar lebih dulu (MB)."""
+    with _lock:
+        df = pd.DataFrame(list(_datasets.values()))
+    if not df.empty:
+        df["mb"] = (df["bytes"] / 1024 / 1024).round(2)
+        df = df.sort_values("bytes", ascending=False, ignore_index=True)
+    return df
@@ -0,0 +1,187 @@
+"""
+Loader hemat memori untuk hasil query besar (scope TOP_MGMT / manager).
+
+Baris dibaca lewat server-side cursor (stream_results) per chunk, dan setiap chunk langsung
+dikonversi sebelum chunk berikutnya dibaca. Puncak memori saat load ~ hasil akhir ditambah
+satu chunk mentah.
+
+- `load_frame`: DataFrame ringkas (categorical untuk teks berulang, float64 untuk harga,
+  datetime64 untuk tanggal); chunk digabung dengan union_categoricals (dipakai Kanban).
+- `load_table`: tabel Arrow (teks tanpa objek Python per nilai); schema yang sama dengan
+  snapshot Arrow, jadi base & delta dashboard bisa digabung tanpa konversi.
+"""
+import datetime
+import time
+
+import pandas as pd
+import pyarrow as pa
+from pandas.api.types import union_categoricals
+from sqlalchemy import text
+
+LOAD_CHUNK_ROWS = 20000
+MONEY_COLUMNS = ['cost', 'selling_price']
+# Teks dijadikan categorical jika nilai unik di chunk pertama <= rasio ini dari jumlah baris
+CATEGORICAL_MAX_RATIO = 0.5
+
+class _ChunkPlan:
+    """Keputusan dtype per kolom diambil dari chunk pertama, lalu dipakai untuk semua chunk."""
+
+    def __init__(self, chunk, categorical):
+        self.money = [c for c in MONEY_COLUMNS if c in chunk.columns]
+        self.dates = []
+        self.categorical = []
+        for col in chunk.columns:
+            if col in self.money or chunk[col].dtype != object:
+                continue
+            sample = chunk[col].dropna()
+            if not sample.empty and isinstance(sample.iloc[0], datetime.date):
+                self.dates.append(col)
+            elif col in categorical or sample.nunique() <= CATEGORICAL_MAX_RATIO * max(len(chunk), 1):
+                self.categorical.append(col)
+
+    def apply(self, chunk):
+        for col in self.money:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('float64')
+        for col in self.dates:
+            chunk[col] = pd.to_datetime(chunk[col], errors='coerce')
+        for col in self.categorical:
+            chunk[col] = chunk[col].astype('category')
+        for col in chunk.select_dtypes(include='integer').columns:
+            chunk[col] = pd.to_numeric(chunk[col], downcast='integer')
+        return chunk
+
+def concat_frames(frames):
+    """pd.concat yang mempertahankan kolom categorical (kategori digabung, bukan jadi object)."""
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+
+    columns = {}
+    for col in frames[0].columns:
+        parts = [f[col] for f in frames if col in f.columns]
+        if all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+            columns[col] = pd.Series(union_categoricals(parts, ignore_order=True), name=col)
+        else:
+            columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum()) if df is not None else 0
+
+def load_frame(engine, query, params=None, chunk_rows=LOAD_CHUNK_ROWS, categorical=()):
+    """
+    Jalankan `query` dengan server-side cursor dan bangun DataFrame ringkas per chunk.
+    `categorical`: kolom yang selalu dijadikan categorical (mis. kolom slicer).
+    Return (DataFrame, dict statistik {rows, bytes, chunks, seconds}).
+    """
+    start = time.perf_counter()
+    frames = []
+    plan = None
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(text(query), params or {})
+        columns = list(result.keys())
+        for rows in result.partitions(chunk_rows):
+            chunk = pd.DataFrame(rows, columns=columns)
+            if plan is None:
+                plan = _ChunkPlan(chunk, set(categorical))
+            frames.append(plan.apply(chunk))
+
+    df = concat_frames(frames) if frames else pd.DataFrame(columns=columns)
+    stats = {
+        "rows": len(df),
+        "bytes": frame_bytes(df),
+        "chunks": len(frames),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    return df, stats
+
+# ==============================================================================
+# ARROW
+# ==============================================================================
+
+# OID tipe PostgreSQL (type_code di cursor.description psycopg2) -> tipe Arrow.
+# OID lain (teks, uuid, json, interval, ...) disimpan sebagai string.
+PG_ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+    700: pa.float64(), 701: pa.float64(), 790: pa.float64(), 1700: pa.float64(),
+    1082: pa.date32(),
+    1114: pa.timestamp('us'), 1184: pa.timestamp('us', tz='UTC'),
+}
+
+def column_types(description):
+    """
+    Kolom -> tipe Arrow dari tipe kolom hasil query (cursor.description), bukan dari isi
+    chunk, jadi kolom yang seluruhnya NULL di chunk pertama tetap bertipe benar.
+    Return None jika driver tidak memberi tipe (mis. sqlite): tipe ditebak per chunk.
+    """
+    if not description or all(col[1] is None for col in description):
+        return None
+    return {
+        col[0]: pa.float64() if col[0] in MONEY_COLUMNS else PG_ARROW_TYPES.get(col[1], pa.string())
+        for col in description
+    }
+
+def null_as_string(schema):
+    """Kolom bertipe null (tebakan dari nilai yang seluruhnya NULL) -> string."""
+    return pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in schema])
+
+def arrow_schema(chunk, types=None):
+    """Schema Arrow untuk chunk: tipe dari `types` (lihat column_types), selain itu ditebak dari chunk."""
+    if types is not None:
+        return pa.schema([pa.field(c, types.get(c, pa.string())) for c in chunk.columns])
+    return pa.Schema.from_pandas(chunk, preserve_index=False)
+
+def arrow_batch(chunk, schema=None, types=None):
+    """
+    Satu chunk hasil query -> RecordBatch (harga selalu float64). Dengan `schema`, nilai
+    dikonversi ke tipe schema (angka dari Decimal, teks dari nilai non-string); tanpa
+    `schema`, schema diambil dari arrow_schema(chunk, types).
+    """
+    for col in MONEY_COLUMNS:
+        if col in chunk.columns:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('float64')
+    schema = schema or arrow_schema(chunk, types)
+    for field in schema:
+        values = chunk[field.name]
+        if pa.types.is_floating(field.type) and values.dtype == object:
+            chunk[field.name] = pd.to_numeric(values, errors='coerce').astype('float64')
+        elif pa.types.is_string(field.type) \
+                and pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+            chunk[field.name] = values.map(str, na_action='ignore')
+    return pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+
+def load_table(engine, query, params=None, chunk_rows=LOAD_CHUNK_ROWS, schema=None):
+    """
+    Seperti load_frame tetapi hasilnya tabel Arrow. Tipe kolom diambil dari hasil query
+    (column_types), atau dari `schema` acuan (mis. base dashboard) sehingga delta kecil
+    selalu cocok dengan base. Jika driver tidak memberi tipe, tipe ditebak per chunk lalu
+    dipromosikan saat digabung (NULL di chunk pertama tidak mengunci tipe).
+    Return (pa.Table, dict statistik {rows, bytes, chunks, seconds}).
+    """
+    start = time.perf_counter()
+    tables = []
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(text(query), params or {})
+        columns = list(result.keys())
+        types = column_types(result.cursor.description) if schema is None else None
+        for rows in result.partitions(chunk_rows):
+            batch = arrow_batch(pd.DataFrame(rows, columns=columns), schema, types)
+            tables.append(pa.Table.from_batches([batch]))
+
+    if tables:
+        table = pa.concat_tables(tables, promote_options="permissive")
+    else:
+        empty = arrow_batch(pd.DataFrame(columns=columns), schema, types)  # teks, harga float64
+        table = pa.Table.from_batches([], schema=empty.schema)
+    if schema is None and any(pa.types.is_null(f.type) for f in table.schema):
+        table = table.cast(null_as_string(table.schema))
+    stats = {
+        "rows": table.num_rows,
+        "bytes": table.nbytes,
+        "chunks": len(tables),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    return table, stats
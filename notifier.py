@@ -0,0 +1,368 @@
+"""
+Outbox notifikasi email.
+
+Write path hanya memasukkan baris ke tabel `notification_outbox` di dalam transaksi
+yang sama dengan perubahan datanya. OutboxWorker mengirimkannya di background dengan
+satu koneksi SMTP yang dipakai ulang, retry dengan backoff eksponensial, dan mencatat
+status pengiriman (pending -> sent / failed).
+
+Notifikasi ke presales disimpan sebagai event (enqueue_event) dan digabung menjadi satu
+email digest per penerima per DIGEST_WINDOW_SECONDS, sehingga update harga berulang
+dan perubahan stage Closed Won/Lost dalam periode yang sama hanya menghasilkan satu email.
+
+Worker berjalan sebagai thread di proses Streamlit (backend.start_notification_worker)
+atau sebagai proses terpisah:
+
+    python notifier.py                     # koneksi DB & SMTP dari secrets.toml
+    python notifier.py --url postgresql://... --smtp-server localhost --smtp-port 8025 --no-starttls
+"""
+import argparse
+import html
+import json
+import logging
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 5
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+DIGEST_WINDOW_SECONDS = 600
+
+EVENT_PRICE_UPDATE = "price_update"
+EVENT_STAGE_CLOSED = "stage_closed"
+
+# ==============================================================================
+# SQL OUTBOX (juga di-EXPLAIN oleh `python migrations.py check`)
+# ==============================================================================
+
+ENQUEUE_EVENT_SQL = """
+    INSERT INTO notification_outbox (recipient, recipient_name, event_type, payload)
+    VALUES (:rcpt, :rname, :etype, CAST(:payload AS jsonb))
+"""
+
+# Penerima yang event tertuanya sudah melewati digest window
+DUE_RECIPIENTS_SQL = """
+    SELECT recipient
+    FROM notification_outbox
+    WHERE status = 'pending' AND next_attempt_at <= NOW()
+    GROUP BY recipient
+    HAVING MIN(created_at) <= NOW() - make_interval(secs => :window)
+    LIMIT :n
+"""
+
+# SKIP LOCKED: beberapa worker (multi proses) tidak mengirim event yang sama;
+# event yang sedang backoff (next_attempt_at di masa depan) tidak ikut dikirim ulang
+RECIPIENT_EVENTS_SQL = """
+    SELECT id, recipient_name, event_type, payload, attempts
+    FROM notification_outbox
+    WHERE status = 'pending' AND recipient = :rcpt AND next_attempt_at <= NOW()
+    ORDER BY id
+    FOR UPDATE SKIP LOCKED
+"""
+
+MARK_SENT_SQL = """
+    UPDATE notification_outbox
+    SET status = 'sent', sent_at = NOW(), attempts = attempts + 1, last_error = NULL,
+        subject = :subj
+    WHERE id = ANY(:ids)
+"""
+
+MARK_FAILED_SQL = """
+    UPDATE notification_outbox
+    SET attempts = attempts + 1,
+        last_error = :err,
+        status = CASE WHEN :final THEN 'failed' ELSE status END,
+        next_attempt_at = NOW() + make_interval(secs => :delay)
+    WHERE id = ANY(:ids)
+"""
+
+# ==============================================================================
+# ENQUEUE (DIPANGGIL DI DALAM TRANSAKSI WRITE)
+# ==============================================================================
+
+def enqueue_event(connection, recipient, recipient_name, event_type, payload):
+    """Menambahkan event notifikasi (digabung ke digest penerima oleh worker)."""
+    connection.execute(
+        text(ENQUEUE_EVENT_SQL),
+        {"rcpt": recipient, "rname": recipient_name, "etype": event_type, "payload": json.dumps(payload, default=str)}
+    )
+
+# ==============================================================================
+# RENDER DIGEST
+# ==============================================================================
+
+def _render_price_updates(events):
+    """Satu baris per opportunity, walau harganya diupdate berkali-kali dalam window."""
+    by_opp = {}
+    for ev in events:
+        entry = by_opp.setdefault(ev['opportunity_id'], {"name": ev['opportunity_name'], "actors": [], "count": 0})
+        entry["count"] += 1
+        if ev['actor'] not in entry["actors"]:
+            entry["actors"].append(ev['actor'])
+
+    items = ""
+    for oid, entry in by_opp.items():
+        times = f" ({entry['count']}x)" if entry['count'] > 1 else ""
+        items += (
+            f"<li><b>{html.escape(str(entry['name']))}</b> (ID: {html.escape(str(oid))}){times}"
+            f" - oleh {html.escape(', '.join(map(str, entry['actors'])))}</li>"
+        )
+    return f"""
+    <h3>📢 Notifikasi Harga Jual (Selling Price) Terupdate</h3>
+    <p>Data Entry baru saja menginput atau memperbarui <i>Selling Price</i> untuk Opportunity berikut:</p>
+    <ul>{items}</ul>
+    <p style="padding: 10px; border-left: 4px solid #28a745; background-color: #f9f9f9;">
+    <b>Pesan:</b><br>
+    Jika ada <i>update cost</i> atau <i>update solution details</i> terkait penawaran harga ini, mohon bantu update di Presales App.
+    </p>
+    """
+
+def _render_stage_closed(ev):
+    items_html = "<ul>"
+    for item in ev.get('items', []):
+        cost = item.get('cost')
+        cost_fmt = f"{float(cost):,.0f}" if cost is not None else "0"
+        items_html += f"<li>{html.escape(str(item.get('solution')))} ({html.escape(str(item.get('brand')))}) - Initial Cost: Rp {cost_fmt}</li>"
+    items_html += "</ul>"
+    return f"""
+    <h3>Status Update: {html.escape(ev['stage'].upper())}</h3>
+    <p>Opportunity berikut telah diubah statusnya menjadi <b>{html.escape(ev['stage'])}</b> oleh Sales ({html.escape(str(ev['actor']))}).</p>
+    <p><b>Customer:</b> {html.escape(str(ev.get('company_name')))}<br><b>Opportunity:</b> {html.escape(str(ev['opportunity_name']))}</p>
+    <p>Mohon segera login ke Presales App dan update <b>Final Cost</b> (Harga Beli/Modal Real) untuk item-item berikut:</p>
+    {items_html}
+    """
+
+def render_digest(recipient_name, events):
+    """
+    Merangkai satu email dari list (event_type, payload). Subject mengikuti email
+    tunggal lama jika hanya ada satu opportunity, selain itu berupa ringkasan.
+    Return (subject, body_html).
+    """
+    price_events = [p for t, p in events if t == EVENT_PRICE_UPDATE]
+    stage_events = [p for t, p in events if t == EVENT_STAGE_CLOSED]
+
+    opp_names = {p['opportunity_id']: p['opportunity_name'] for _, p in events}
+    if len(opp_names) == 1 and not stage_events:
+        subject = f"[Reminder] Update Cost/Solution: {next(iter(opp_names.values()))}"
+    elif len(opp_names) == 1 and len(stage_events) == 1 and not price_events:
+        subject = f"[Action Required] Opportunity {stage_events[0]['stage']}: {stage_events[0]['opportunity_name']}"
+    else:
+        subject = f"[Sales App] Ringkasan update {len(opp_names)} opportunity"
+
+    sections = [_render_stage_closed(ev) for ev in stage_events]
+    if price_events:
+        sections.append(_render_price_updates(price_events))
+
+    body_html = f"""
+    <p>Halo <b>{html.escape(str(recipient_name or ''))}</b>,</p>
+    {'<hr>'.join(sections)}
+    <br>
+    <p><i>Terima kasih,<br>Sales App Automation</i></p>
+    """
+    return subject, body_html
+
+# ==============================================================================
+# SMTP SENDER (KONEKSI PERSISTEN)
+# ==============================================================================
+
+def build_message(sender, recipient, subject, body_html):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body_html, 'html'))
+    return msg
+
+class SmtpSender:
+    """
+    Koneksi SMTP yang dibuka sekali dan dipakai ulang antar email.
+    Config mengikuti blok [smtp] di secrets.toml: server, port, email, password,
+    plus opsional `starttls` (default True) dan `timeout` (default 10 detik).
+    """
+
+    def __init__(self, config):
+        self.server = config.get("server")
+        self.port = int(config.get("port", 587))
+        self.sender = config.get("email")
+        self.password = config.get("password")
+        self.starttls = bool(config.get("starttls", True))
+        self.timeout = float(config.get("timeout", 10))
+        self._smtp = None
+
+    def is_configured(self):
+        return bool(self.server and self.sender)
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.password:
+            smtp.login(self.sender, self.password)
+        self._smtp = smtp
+
+    def _ensure_connected(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.close()
+        self._connect()
+
+    def send(self, recipient, subject, body_html):
+        self._ensure_connected()
+        try:
+            self._smtp.send_message(build_message(self.sender, recipient, subject, body_html))
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Koneksi putus di tengah jalan: buka ulang sekali lalu coba lagi
+            self.close()
+            self._connect()
+            self._smtp.send_message(build_message(self.sender, recipient, subject, body_html))
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+# ==============================================================================
+# OUTBOX WORKER
+# ==============================================================================
+
+def backoff_seconds(attempts):
+    """Jeda sebelum percobaan berikutnya: 30s, 60s, 120s, ... maksimal 1 jam."""
+    return min(BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), BACKOFF_MAX_SECONDS)
+
+class OutboxWorker(threading.Thread):
+    """Thread yang mengosongkan notification_outbox secara berkala."""
+
+    def __init__(self, engine, smtp_config, poll_interval=POLL_INTERVAL_SECONDS,
+                 batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS, digest_window=DIGEST_WINDOW_SECONDS):
+        super().__init__(name="notification-outbox", daemon=True)
+        self.engine = engine
+        self.sender = SmtpSender(smtp_config)
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.digest_window = digest_window
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        logger.info("Notification outbox worker started")
+        while not self._stop_event.is_set():
+            try:
+                processed = self.drain_once()
+            except Exception:
+                logger.exception("Outbox drain failed")
+                processed = 0
+            if not processed:
+                self._stop_event.wait(self.poll_interval)
+        self.sender.close()
+
+    def drain_once(self):
+        """Mengirim digest yang jatuh tempo. Return jumlah baris outbox yang diproses."""
+        return self._drain_digests()
+
+    def _drain_digests(self):
+        """Event per penerima yang event tertuanya sudah melewati digest window."""
+        with self.engine.connect() as connection:
+            recipients = connection.execute(
+                text(DUE_RECIPIENTS_SQL),
+                {"window": self.digest_window, "n": self.batch_size}
+            ).scalars().all()
+            connection.rollback()
+
+        processed = 0
+        for recipient in recipients:
+            with self.engine.begin() as connection:
+                rows = connection.execute(text(RECIPIENT_EVENTS_SQL), {"rcpt": recipient}).mappings().all()
+                if not rows:
+                    continue
+
+                subject, body_html = render_digest(
+                    rows[-1]['recipient_name'], [(r['event_type'], r['payload']) for r in rows]
+                )
+                self._deliver(
+                    connection, [r['id'] for r in rows], recipient, subject, body_html,
+                    max(r['attempts'] for r in rows)
+                )
+                processed += len(rows)
+        return processed
+
+    def _deliver(self, connection, ids, recipient, subject, body_html, attempts):
+        try:
+            self.sender.send(recipient, subject, body_html)
+        except Exception as e:
+            self.sender.close()
+            self._mark_failed_attempt(connection, ids, attempts + 1, e)
+            return False
+
+        connection.execute(text(MARK_SENT_SQL), {"ids": ids, "subj": subject})
+        return True
+
+    def _mark_failed_attempt(self, connection, ids, attempts, error):
+        final = attempts >= self.max_attempts
+        logger.warning("Outbox delivery %s failed (attempt %s): %s", ids, attempts, error)
+        connection.execute(
+            text(MARK_FAILED_SQL),
+            {"ids": ids, "err": str(error)[:500], "final": final, "delay": backoff_seconds(attempts)}
+        )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker pengirim email dari notification_outbox")
+    parser.add_argument("--url", help="SQLAlchemy URL database (default: secrets.toml)")
+    parser.add_argument("--smtp-server")
+    parser.add_argument("--smtp-port", type=int)
+    parser.add_argument("--no-starttls", action="store_true")
+    parser.add_argument("--once", action="store_true", help="Kirim satu batch lalu keluar")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    import migrations
+    engine = migrations.get_engine(args.url)
+
+    smtp_config = {}
+    try:
+        import streamlit as st
+        smtp_config = dict(st.secrets.get("smtp", {}))
+    except Exception:
+        pass
+    if args.smtp_server: smtp_config["server"] = args.smtp_server
+    if args.smtp_port: smtp_config["port"] = args.smtp_port
+    if args.no_starttls: smtp_config["starttls"] = False
+    smtp_config.setdefault("email", "sales-app@localhost")
+
+    worker = OutboxWorker(engine, smtp_config)
+    if not worker.sender.is_configured():
+        print("⚠️ SMTP server belum dikonfigurasi ([smtp] di secrets.toml atau --smtp-server)")
+        return 1
+    if args.once:
+        print(f"Processed {worker.drain_once()} notification(s)")
+        worker.sender.close()
+        return 0
+
+    worker.start()
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        worker.stop()
+        worker.join()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
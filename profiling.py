@@ -0,0 +1,104 @@
+"""
+Profiling render per fragment (Kanban, Dashboard, Update Price).
+
+Aktif jika URL memakai `?profile=1` atau di secrets.toml:
+
+    [diagnostics]
+    profile = true
+
+Di dalam fragment yang dibungkus `@profiled("nama")`, `phase("load")` mengukur waktu
+tiap fase (load, preprocess, filter, render; fase yang sama boleh berulang dan dijumlahkan)
+dan `count("widgets", n)` / `count("rows", n)` menghitung elemen & baris yang dikirim ke UI.
+Saat tidak aktif keduanya no-op. Laporan disimpan di session_state (ditampilkan di sidebar
+pada full rerun) dan dicetak ke log (juga untuk rerun fragment saja).
+"""
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import streamlit as st
+
+_current = ContextVar("profiling_current", default=None)
+
+def enabled():
+    try:
+        if str(st.query_params.get("profile", "")).lower() in ("1", "true", "yes"):
+            return True
+        return bool(st.secrets.get("diagnostics", {}).get("profile", False))
+    except Exception:
+        return False
+
+class FragmentProfile:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counts = {}
+
+    def add_phase(self, phase_name, ms):
+        self.phases[phase_name] = self.phases.get(phase_name, 0.0) + ms
+
+    def add_count(self, key, n):
+        self.counts[key] = self.counts.get(key, 0) + n
+
+    def report(self):
+        total_ms = (time.perf_counter() - self.started) * 1000
+        phases = {k: round(v, 1) for k, v in self.phases.items()}
+        phases["other"] = round(max(total_ms - sum(self.phases.values()), 0.0), 1)
+        return {"fragment": self.name, "total_ms": round(total_ms, 1), "phases": phases, "counts": dict(self.counts)}
+
+@contextmanager
+def phase(phase_name):
+    """Ukur satu fase di fragment yang sedang diprofil (no-op jika profiling mati)."""
+    prof = _current.get()
+    if prof is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.add_phase(phase_name, (time.perf_counter() - start) * 1000)
+
+def count(key, n=1):
+    prof = _current.get()
+    if prof is not None:
+        prof.add_count(key, int(n))
+
+def _publish(report):
+    st.session_state.setdefault("profile_reports", {})[report["fragment"]] = report
+    phases = " ".join(f"{k}={v:.0f}ms" for k, v in report["phases"].items())
+    counts = " ".join(f"{k}={v}" for k, v in report["counts"].items())
+    print(f"⏱️ [profile] {report['fragment']} total={report['total_ms']:.0f}ms {phases} {counts}")
+
+def profiled(name):
+    """Decorator untuk fungsi fragment: aktifkan profil selama fragment berjalan."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return fn(*args, **kwargs)
+            prof = FragmentProfile(name)
+            token = _current.set(prof)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _current.reset(token)
+                _publish(prof.report())
+        return wrapper
+    return decorator
+
+def render_sidebar():
+    """Laporan profil terakhir per fragment (dipanggil di sidebar pada full rerun)."""
+    if not enabled():
+        return
+    reports = st.session_state.get("profile_reports", {})
+    st.divider()
+    st.caption("⏱️ Profiling fragment (run terakhir)")
+    if not reports:
+        st.caption("Belum ada data; laporan muncul setelah rerun berikutnya.")
+        return
+    for report in reports.values():
+        with st.expander(f"{report['fragment']}: {report['total_ms']:.0f} ms"):
+            st.json({"phases_ms": report["phases"], "counts": report["counts"]})
@@ -0,0 +1,270 @@
+"""
+Snapshot Arrow (Feather v2) tabel opportunities yang dibagi semua proses di satu host.
+
+- Dibangun di background (satu proses saja, file lock antar proses) atau dari CLI
+  (`python snapshot.py build`, mis. dari cron) lewat server-side cursor, diurutkan
+  berdasarkan salesgroup_id, sales_name, lalu ditulis ke file sementara dan di-rename atomik.
+  Request user tidak pernah menunggu build; selama belum ada snapshot, dashboard memuat
+  dari database.
+- Sidecar JSON berisi versi, high-water `updated_at` saat build dan offset baris per
+  salesgroup_id & (salesgroup_id, sales_name).
+- Setiap proses membuka file lewat memory map read-only (halaman dibagi lewat page cache OS);
+  slice per scope adalah zero-copy di level Arrow.
+
+File berisi seluruh tabel (termasuk cost & harga), jadi fitur ini opt-in dan direktorinya
+dibuat dengan mode 0700 milik user proses. Konfigurasi di secrets.toml:
+
+    [snapshot]
+    enabled = true
+    dir = "/var/lib/sales_app/snapshot"
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+from sqlalchemy import create_engine, text
+
+import loader
+
+try:
+    import fcntl
+except ImportError:  # Windows: tanpa lock antar proses
+    fcntl = None
+
+SNAPSHOT_CHUNK_ROWS = 50000
+SNAPSHOT_MAX_AGE_SECONDS = 21600  # sama dengan reload penuh dashboard
+_KEY_SEP = "\x1f"
+
+def _config():
+    try:
+        return dict(st.secrets.get("snapshot", {}))
+    except Exception:
+        return {}
+
+def enabled():
+    return bool(_config().get("enabled", False))
+
+def snapshot_dir():
+    """Direktori snapshot (0700, harus milik user proses ini)."""
+    path = _config().get("dir") or os.path.join(tempfile.gettempdir(), "sales_app_snapshot")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise PermissionError(f"Direktori snapshot {path} bukan milik user proses ini")
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+def _meta_path(directory):
+    return os.path.join(directory, "CURRENT.json")
+
+def read_meta(directory=None):
+    """Metadata snapshot aktif (None jika belum pernah dibangun)."""
+    try:
+        with open(_meta_path(directory or snapshot_dir())) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _is_fresh(meta):
+    return meta is not None and time.time() - meta["built_at"] < SNAPSHOT_MAX_AGE_SECONDS
+
+# ==============================================================================
+# BUILD
+# ==============================================================================
+
+def _track_offsets(chunk, base, offsets):
+    """Catat rentang baris [start, end) per salesgroup & per (salesgroup, sales_name)."""
+    sg = chunk['salesgroup_id'].astype(str).where(chunk['salesgroup_id'].notna(), None)
+    sn = chunk['sales_name'].astype(str).where(chunk['sales_name'].notna(), None)
+    pairs = [sg, sg.str.cat(sn, sep=_KEY_SEP)]
+    for level, keys in zip(("sg", "sg_sn"), pairs):
+        starts = keys.ne(keys.shift()).to_numpy().nonzero()[0]
+        ends = list(starts[1:]) + [len(keys)]
+        for start, end in zip(starts, ends):
+            key = keys.iloc[start]
+            if key is None or pd.isna(key):
+                continue
+            span = offsets[level].setdefault(key, [base + int(start), base + int(end)])
+            span[1] = base + int(end)  # run yang berlanjut dari chunk sebelumnya
+
+def build(engine, directory=None):
+    """Bangun snapshot baru dan jadikan aktif. Return metadata."""
+    directory = directory or snapshot_dir()
+    version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    file_name = f"opportunities-{version}.arrow"
+    tmp_path = os.path.join(directory, f".{file_name}.tmp")
+
+    offsets = {"sg": {}, "sg_sn": {}}
+    rows = 0
+    writer = None
+    schema = None
+    # REPEATABLE READ: high-water dan isi snapshot berasal dari satu snapshot transaksi
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+        high_water = connection.execute(text("SELECT MAX(updated_at) FROM opportunities")).scalar()
+        result = connection.execution_options(stream_results=True, max_row_buffer=SNAPSHOT_CHUNK_ROWS).execute(text(
+            "SELECT * FROM opportunities ORDER BY salesgroup_id, sales_name, opportunity_id, uid"
+        ))
+        columns = list(result.keys())
+        # Tipe dari hasil query, bukan dari chunk pertama: schema file tetap untuk semua batch
+        types = loader.column_types(result.cursor.description)
+        try:
+            for part in result.partitions(SNAPSHOT_CHUNK_ROWS):
+                chunk = pd.DataFrame(part, columns=columns)
+                batch = loader.arrow_batch(chunk, schema, types)
+                if writer is None:
+                    schema = loader.null_as_string(batch.schema)
+                    batch = batch.cast(schema)
+                    writer = pa.ipc.new_file(tmp_path, schema)  # tanpa kompresi: bisa di-mmap zero-copy
+                writer.write_batch(batch)
+                _track_offsets(chunk, rows, offsets)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    if writer is None:
+        empty = loader.arrow_batch(pd.DataFrame(columns=columns), types=types)
+        pa.ipc.new_file(tmp_path, loader.null_as_string(empty.schema)).close()
+    os.replace(tmp_path, os.path.join(directory, file_name))
+
+    meta = {
+        "version": version,
+        "file": file_name,
+        "rows": rows,
+        "built_at": time.time(),
+        "high_water": pd.Timestamp(high_water).isoformat() if high_water is not None else None,
+        "offsets": offsets,
+    }
+    meta_tmp = _meta_path(directory) + ".tmp"
+    with open(meta_tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_tmp, _meta_path(directory))
+
+    # File versi lama dihapus; proses yang masih me-mmap-nya tetap aman (unlink POSIX)
+    for name in os.listdir(directory):
+        if name.startswith("opportunities-") and name != file_name:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+    return meta
+
+def build_if_stale(engine, directory=None):
+    """
+    Bangun snapshot jika belum ada/basi. Jika proses lain sedang build, langsung kembali
+    (tidak menunggu). Return metadata terbaru (bisa None).
+    """
+    directory = directory or snapshot_dir()
+    with open(os.path.join(directory, "build.lock"), "w") as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return read_meta(directory)
+        try:
+            meta = read_meta(directory)  # mungkin baru saja dibangun proses lain
+            if _is_fresh(meta):
+                return meta
+            return build(engine, directory)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+_background_build = threading.Lock()
+
+def _build_in_background(engine, directory):
+    """Paling banyak satu thread build per proses; kegagalan hanya dicatat."""
+    if not _background_build.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            build_if_stale(engine, directory)
+        except Exception as e:
+            print(f"⚠️ Build snapshot Arrow gagal: {e}")
+        finally:
+            _background_build.release()
+
+    threading.Thread(target=run, name="snapshot-build", daemon=True).start()
+
+def current_meta(engine, directory=None):
+    """
+    Metadata snapshot yang ada sekarang (boleh basi; None jika belum pernah dibangun).
+    Snapshot yang basi/belum ada dibangun ulang di background, bukan di request ini.
+    """
+    directory = directory or snapshot_dir()
+    meta = read_meta(directory)
+    if not _is_fresh(meta):
+        _build_in_background(engine, directory)
+    return meta
+
+# ==============================================================================
+# READ (MEMORY MAP)
+# ==============================================================================
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _open_table(path):
+    """Tabel Arrow di atas memory map read-only (satu per versi file per proses)."""
+    source = pa.memory_map(path, "r")
+    return pa.ipc.open_file(source).read_all()
+
+def scope_slice(meta, sales_group, sales_name, is_super_user, directory=None):
+    """Slice Arrow zero-copy untuk scope otoritas (TOP_MGMT = seluruh tabel)."""
+    table = _open_table(os.path.join(directory or snapshot_dir(), meta["file"]))
+    if sales_group == 'TOP_MGMT':
+        return table
+    if is_super_user:
+        span = meta["offsets"]["sg"].get(str(sales_group))
+    else:
+        span = meta["offsets"]["sg_sn"].get(f"{sales_group}{_KEY_SEP}{sales_name}")
+    if span is None:
+        return table.slice(0, 0)
+    return table.slice(span[0], span[1] - span[0])
+
+def high_water(meta):
+    return datetime.fromisoformat(meta["high_water"]) if meta and meta.get("high_water") else None
+
+# ==============================================================================
+# CLI: python snapshot.py build|status [--url ...]
+# ==============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshot Arrow bersama untuk dashboard")
+    parser.add_argument("command", choices=["build", "status"])
+    parser.add_argument("--url", help="SQLAlchemy URL database (default: secrets.toml)")
+    parser.add_argument("--dir", help="Direktori snapshot (default: [snapshot] dir di secrets.toml)")
+    parser.add_argument("--force", action="store_true", help="build: bangun ulang walau masih segar")
+    args = parser.parse_args(argv)
+    directory = args.dir or snapshot_dir()
+    if args.dir:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    if args.command == "build":
+        url = args.url or os.environ.get("DATABASE_URL")
+        engine = create_engine(url) if url else st.connection("postgresql", type="sql").engine
+        meta = build(engine, directory) if args.force else build_if_stale(engine, directory)
+        if meta is None:
+            print("⏳ Snapshot sedang dibangun proses lain.")
+            return 1
+        print(f"✅ Snapshot {meta['version']}: {meta['rows']} baris")
+        return 0
+
+    meta = read_meta(directory)
+    if meta is None:
+        print("⏳ Belum ada snapshot.")
+        return 1
+    age = time.time() - meta["built_at"]
+    mark = "✅" if _is_fresh(meta) else "⚠️ basi"
+    print(f"{mark} {meta['version']}: {meta['rows']} baris, umur {age / 60:.0f} menit, high-water {meta['high_water']}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modul app berupa file datar di root repo (tanpa package)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
@@ -0,0 +1,114 @@
+"""Filter engine dashboard: SlicerIndex (interseksi, cascading) & DashboardFrame di atas Arrow."""
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+try:
+    import dashboard_engine as engine
+except Exception as e:  # backend membuka koneksi [connections.postgresql] saat import
+    pytest.skip(f"backend tidak bisa diimport: {e}", allow_module_level=True)
+
+
+STAGES = ["Closed Won", "Open", "Unknown"]
+COMPANIES = ["Alpha", "Beta"]
+#            row: 0  1  2  3  4  5
+STAGE_CODES = [1, 1, 0, 2, 1, 0]
+COMPANY_CODES = [0, 1, 0, 0, 1, 1]
+DATES = np.array(["2024-01-05", "2024-02-01", "NaT", "2024-01-20", "2024-03-01", "2024-01-10"], dtype="datetime64[D]")
+
+
+def _index(hidden=None):
+    codes = {"stage": np.array(STAGE_CODES, dtype=np.int32), "company_name": np.array(COMPANY_CODES, dtype=np.int32)}
+    categories = {"stage": pd.Index(STAGES), "company_name": pd.Index(COMPANIES)}
+    return engine.SlicerIndex(len(STAGE_CODES), codes, categories, DATES, hidden)
+
+
+def _brute_force(stages=None, companies=None, date_range=None, hidden=()):
+    rows = []
+    for i in range(len(STAGE_CODES)):
+        if i in hidden:
+            continue
+        if stages and STAGES[STAGE_CODES[i]] not in stages:
+            continue
+        if companies and COMPANIES[COMPANY_CODES[i]] not in companies:
+            continue
+        if date_range and (np.isnat(DATES[i]) or not (np.datetime64(date_range[0]) <= DATES[i] <= np.datetime64(date_range[1]))):
+            continue
+        rows.append(i)
+    return rows
+
+
+def test_resolve_without_filters_means_all_rows():
+    assert _index().resolve({"stage": [], "company_name": []}) is None
+
+
+@pytest.mark.parametrize("stages, companies, date_range", [
+    (["Open"], None, None),
+    (["Open", "Closed Won"], ["Alpha"], None),
+    (None, ["Beta"], (dt.date(2024, 1, 1), dt.date(2024, 1, 31))),
+    (["Open"], ["Beta"], (dt.date(2024, 2, 1), dt.date(2024, 2, 1))),
+    (["Tidak Ada"], None, None),
+])
+def test_resolve_is_intersection_of_filters(stages, companies, date_range):
+    selections = {"stage": stages or [], "company_name": companies or []}
+    rows = _index().resolve(selections, date_range)
+    assert list(rows) == _brute_force(stages, companies, date_range)
+
+
+def test_hidden_rows_are_never_returned():
+    index = _index(hidden=np.array([1, 4]))
+    assert list(index.resolve({})) == [0, 2, 3, 5]
+    assert list(index.resolve({"stage": ["Open"]})) == _brute_force(["Open"], hidden=(1, 4))
+    assert list(index.rows_in_date_range(dt.date(2024, 1, 1), dt.date(2024, 12, 31))) == [0, 3, 5]
+
+
+def test_option_counts_ignore_own_filter():
+    counts = _index().option_counts({"stage": ["Open"], "company_name": ["Alpha"]})
+    # stage dihitung dengan filter company saja; company dengan filter stage saja
+    assert counts["stage"].tolist() == [1, 1, 1]
+    assert counts["company_name"].tolist() == [1, 2]
+
+
+def test_option_counts_apply_date_range_to_every_column():
+    counts = _index(hidden=np.array([0])).option_counts({}, (dt.date(2024, 1, 1), dt.date(2024, 1, 31)))
+    assert counts["stage"].tolist() == [1, 0, 1]
+    assert counts["company_name"].tolist() == [1, 1]
+
+
+def _frame(hidden=None):
+    table = pa.table({
+        "uid": ["u1", "u2", "u3", "u4"],
+        "opportunity_id": ["A", "A", "B", "C"],
+        "company_name": ["Beta", None, "Alpha", "Beta"],
+        "stage": ["Open", "Open", "Closed Won", "Open"],
+        "selling_price": [10.0, None, 30.0, 40.0],
+        "start_date": pa.array([dt.date(2024, 1, 1), dt.date(2024, 1, 2), None, dt.date(2024, 3, 1)]),
+    })
+    return engine.DashboardFrame(table, hidden)
+
+
+def test_slicer_codes_map_null_to_unknown_in_sorted_order():
+    codes, categories = engine.slicer_codes(pa.chunked_array([["Beta", None], ["Alpha", "Beta"]]))
+    assert categories.tolist() == ["Alpha", "Beta", "Unknown"]
+    assert codes.tolist() == [1, 2, 0, 1]
+
+
+def test_cascading_options_keep_selected_values():
+    options = _frame().cascading_options({"stage": ["Closed Won"], "company_name": ["Beta"]})
+    opts, counts = options["company_name"]
+    assert opts == ["Alpha", "Beta"]  # Beta tetap muncul walau 0 baris Closed Won
+    assert counts == {"Alpha": 1, "Beta": 0}
+    assert options["stage"][1] == {"Closed Won": 0, "Open": 2}
+
+
+def test_query_and_page_skip_hidden_rows():
+    frame = _frame(hidden=np.array([3]))
+    summary = frame.query({"stage": ["Open"]})
+    assert summary == {"rows": 2, "unique_opportunities": 1, "unique_customers": 2, "total_value": 10.0}
+    page = frame.page({}, None, "selling_price", descending=True, offset=0, limit=10)
+    assert page["opportunity_id"].tolist() == ["B", "A", "A"]
+    assert page["selling_price"].tolist() == [30.0, 10.0, 0.0]
+    assert (frame.date_min, frame.date_max) == (dt.date(2024, 1, 1), dt.date(2024, 1, 2))
@@ -0,0 +1,50 @@
+"""Konversi chunk hasil query ke Arrow: kolom yang NULL di chunk pertama tidak mengunci tipe."""
+import datetime
+
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import create_engine, text
+
+import loader
+
+# cursor.description psycopg2: (name, type_code, ...); 1082 = date, 1184 = timestamptz
+DESCRIPTION = [("uid", 25), ("start_date", 1082), ("updated_at", 1184), ("selling_price", 1700)]
+COLUMNS = [col[0] for col in DESCRIPTION]
+
+
+def test_all_null_first_chunk_keeps_result_types():
+    types = loader.column_types(DESCRIPTION)
+    first = loader.arrow_batch(pd.DataFrame([("a", None, None, None)], columns=COLUMNS), types=types)
+    later = loader.arrow_batch(
+        pd.DataFrame([("b", datetime.date(2024, 5, 1), datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc), "12.5")],
+                     columns=COLUMNS),
+        first.schema,
+    )
+
+    assert first.schema.field("start_date").type == pa.date32()
+    assert first.schema.field("updated_at").type == pa.timestamp("us", tz="UTC")
+    table = pa.Table.from_batches([first, later])
+    assert table["start_date"].to_pylist() == [None, datetime.date(2024, 5, 1)]
+    assert table["selling_price"].to_pylist() == [None, 12.5]
+
+
+def test_delta_values_follow_base_schema():
+    base_schema = loader.null_as_string(pa.schema([("uid", pa.string()), ("notes", pa.null())]))
+    delta = loader.arrow_batch(pd.DataFrame([("a", 7)], columns=["uid", "notes"]), base_schema)
+
+    assert delta.schema == base_schema
+    assert delta["notes"].to_pylist() == ["7"]
+
+
+def test_load_table_promotes_types_without_driver_types(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rows.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE t (id INTEGER, qty INTEGER, note TEXT)"))
+        connection.execute(text("INSERT INTO t VALUES (1, NULL, NULL), (2, 5, NULL), (3, 8, 'x')"))
+
+    table, stats = loader.load_table(engine, "SELECT id, qty, note FROM t ORDER BY id", chunk_rows=1)
+
+    assert stats["chunks"] == 3
+    assert pa.types.is_integer(table.schema.field("qty").type) or pa.types.is_floating(table.schema.field("qty").type)
+    assert table["qty"].to_pylist() == [None, 5, 8]
+    assert table["note"].to_pylist() == [None, None, "x"]
@@ -0,0 +1,10 @@
+"""Urutan migrasi: startup app hanya menerapkan migrasi transaksional yang mendahului migrasi CLI."""
+import migrations
+
+
+def test_transactional_migrations_precede_cli_migrations():
+    versions = [version for version, _, _ in migrations.MIGRATIONS]
+    first_cli = min(migrations.CONCURRENT_MIGRATIONS)
+
+    assert versions == sorted(versions)
+    assert all(version in migrations.CONCURRENT_MIGRATIONS for version in versions if version >= first_cli)
@@ -0,0 +1,44 @@
+"""render_digest: satu email per penerima untuk banyak event dalam satu window."""
+import notifier
+
+
+def _price(oid, name, actor):
+    return (notifier.EVENT_PRICE_UPDATE, {"opportunity_id": oid, "opportunity_name": name, "actor": actor})
+
+
+def _closed(oid, name, stage="Closed Won"):
+    return (notifier.EVENT_STAGE_CLOSED, {
+        "opportunity_id": oid, "opportunity_name": name, "stage": stage, "actor": "Sales A",
+        "company_name": "PT Contoh", "items": [{"solution": "Firewall", "brand": "Acme", "cost": 1500000}],
+    })
+
+
+def test_repeated_price_updates_coalesce_into_one_line():
+    subject, body = notifier.render_digest("Presales", [
+        _price("OPP-1", "Alpha", "Ani"), _price("OPP-1", "Alpha", "Budi"), _price("OPP-1", "Alpha", "Ani"),
+    ])
+    assert subject == "[Reminder] Update Cost/Solution: Alpha"
+    assert body.count("<li>") == 1
+    assert "(3x)" in body
+    assert "oleh Ani, Budi" in body
+
+
+def test_single_stage_close_keeps_action_required_subject():
+    subject, body = notifier.render_digest("Presales", [_closed("OPP-2", "Beta", "Closed Lost")])
+    assert subject == "[Action Required] Opportunity Closed Lost: Beta"
+    assert "Initial Cost: Rp 1,500,000" in body
+
+
+def test_mixed_events_for_several_opportunities_make_a_summary():
+    subject, body = notifier.render_digest("Presales", [
+        _price("OPP-1", "Alpha", "Ani"), _closed("OPP-2", "Beta"), _price("OPP-3", "Gamma", "Ani"),
+    ])
+    assert subject == "[Sales App] Ringkasan update 3 opportunity"
+    assert body.count("<hr>") == 1  # satu section stage + satu section harga
+    assert body.index("Status Update: CLOSED WON") < body.index("Selling Price")
+
+
+def test_user_values_are_escaped():
+    _, body = notifier.render_digest("<b>x</b>", [_price("OPP-1", "<script>", "Ani")])
+    assert "<script>" not in body
+    assert "&lt;b&gt;x&lt;/b&gt;" in body
@@ -0,0 +1,93 @@
+"""SmtpSender terhadap server SMTP lokal (aiosmtpd), tanpa database."""
+import socket
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+import notifier
+
+
+class _Collect:
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        self.sessions.add(session.peer)  # (host, port) klien = satu koneksi
+        return "250 OK"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = _Collect()
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    try:
+        yield handler, controller
+    finally:
+        controller.stop()
+
+
+def _config(controller, **extra):
+    return {"server": controller.hostname, "port": controller.port, "email": "sales-app@localhost",
+            "starttls": False, "timeout": 5, **extra}
+
+
+def test_is_configured_needs_server_and_sender():
+    assert not notifier.SmtpSender({}).is_configured()
+    assert not notifier.SmtpSender({"server": "localhost"}).is_configured()
+    assert notifier.SmtpSender({"server": "localhost", "email": "a@b"}).is_configured()
+
+
+def test_send_reuses_one_connection(smtp_server):
+    handler, controller = smtp_server
+    sender = notifier.SmtpSender(_config(controller))
+    try:
+        sender.send("presales@example.com", "Satu", "<p>1</p>")
+        sender.send("presales@example.com", "Dua", "<p>2</p>")
+    finally:
+        sender.close()
+
+    assert [m.rcpt_tos for m in handler.messages] == [["presales@example.com"]] * 2
+    assert all(m.mail_from == "sales-app@localhost" for m in handler.messages)
+    assert b"Subject: Dua" in handler.messages[1].content
+    assert len(handler.sessions) == 1
+
+
+def test_send_reconnects_after_server_drop(smtp_server):
+    handler, controller = smtp_server
+    sender = notifier.SmtpSender(_config(controller))
+    try:
+        sender.send("presales@example.com", "Sebelum", "<p>1</p>")
+        sender._smtp.sock.shutdown(socket.SHUT_RDWR)  # koneksi putus di luar kendali sender
+        sender.send("presales@example.com", "Sesudah", "<p>2</p>")
+    finally:
+        sender.close()
+
+    assert [m.content.count(b"Subject: Sesudah") for m in handler.messages] == [0, 1]
+    assert len(handler.sessions) == 2
+
+
+def test_digest_is_delivered_as_single_email(smtp_server):
+    handler, controller = smtp_server
+    events = [
+        (notifier.EVENT_PRICE_UPDATE, {"opportunity_id": "OPP-1", "opportunity_name": "Alpha", "actor": "Ani"}),
+        (notifier.EVENT_PRICE_UPDATE, {"opportunity_id": "OPP-1", "opportunity_name": "Alpha", "actor": "Budi"}),
+    ]
+    subject, body_html = notifier.render_digest("Presales", events)
+    sender = notifier.SmtpSender(_config(controller))
+    try:
+        sender.send("presales@example.com", subject, body_html)
+    finally:
+        sender.close()
+
+    assert len(handler.messages) == 1
+    assert b"Update Cost/Solution: Alpha" in handler.messages[0].content
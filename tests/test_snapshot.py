@@ -0,0 +1,28 @@
+"""Offset baris per scope di snapshot Arrow (_track_offsets)."""
+import pandas as pd
+
+import snapshot
+
+
+def _chunk(pairs):
+    return pd.DataFrame(pairs, columns=["salesgroup_id", "sales_name"])
+
+
+def test_offsets_follow_sorted_runs_across_chunks():
+    offsets = {"sg": {}, "sg_sn": {}}
+    first = _chunk([("G1", "Ani"), ("G1", "Ani"), ("G1", "Budi")])
+    second = _chunk([("G1", "Budi"), ("G2", "Ani"), ("G2", "Ani")])
+    snapshot._track_offsets(first, 0, offsets)
+    snapshot._track_offsets(second, len(first), offsets)
+
+    sep = snapshot._KEY_SEP
+    assert offsets["sg"] == {"G1": [0, 4], "G2": [4, 6]}
+    assert offsets["sg_sn"] == {f"G1{sep}Ani": [0, 2], f"G1{sep}Budi": [2, 4], f"G2{sep}Ani": [4, 6]}
+
+
+def test_rows_without_scope_keys_are_not_indexed():
+    offsets = {"sg": {}, "sg_sn": {}}
+    snapshot._track_offsets(_chunk([("G1", None), ("G1", "Ani"), (None, None)]), 0, offsets)
+
+    assert offsets["sg"] == {"G1": [0, 2]}
+    assert offsets["sg_sn"] == {f"G1{snapshot._KEY_SEP}Ani": [1, 2]}
@@ -2,6 +2,12 @@ import streamlit as st
 import pandas as pd
 import time
 import backend as db
+import dashboard_engine as engine
+import data_access as data
+import exporter
+import instrumentation
+import profiling
+from profiling import phase
 
 def format_idr(value):
     """Format angka ke format Rupiah (e.g., 1.000.000)."""
@@ -12,26 +18,109 @@ def format_idr(value):
     except (ValueError, TypeError):
         return "0"
 
+# ==============================================================================
+# TABEL DETAIL (SORT & PAGING DI SERVER)
+# ==============================================================================
+
+DETAIL_PAGE_SIZE = 50
+# Harga tetap numerik; format Rupiah dilakukan di browser lewat column_config
+MONEY_COLUMN_CONFIG = {
+    "cost": st.column_config.NumberColumn("Cost", format="Rp %.0f"),
+    "selling_price": st.column_config.NumberColumn("Selling Price", format="Rp %.0f"),
+}
+
+def detail_table(key, columns, total_rows, fetch_page, page_size=DETAIL_PAGE_SIZE, default_sort=None):
+    """
+    Tabel detail ter-paging. `fetch_page(sort_by, descending, offset, limit)` mengurutkan &
+    memotong di frame cache atau di SQL; hanya baris halaman aktif yang dikirim ke browser.
+    """
+    n_pages = max(1, -(-total_rows // page_size))
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+
+    def reset_page():
+        st.session_state[page_key] = 1
+
+    c1, c2, c3 = st.columns([3, 1, 2])
+    default_index = columns.index(default_sort) if default_sort in columns else 0
+    sort_by = c1.selectbox("Urutkan berdasarkan", columns, index=default_index, key=f"{key}_sort", on_change=reset_page)
+    descending = c2.toggle("Desc", key=f"{key}_desc", on_change=reset_page)
+    page = c3.number_input(f"Halaman (dari {n_pages})", min_value=1, max_value=n_pages, step=1, key=page_key)
+    profiling.count("widgets", 3)
+
+    offset = (int(page) - 1) * page_size
+    with phase("filter"):
+        df_page = fetch_page(sort_by, descending, offset, page_size)
+    with phase("render"):
+        st.dataframe(
+            df_page, use_container_width=True, hide_index=True,
+            column_config={c: cfg for c, cfg in MONEY_COLUMN_CONFIG.items() if c in df_page.columns}
+        )
+    profiling.count("rows", len(df_page))
+    if total_rows > page_size:
+        st.caption(f"Baris {offset + 1}–{offset + len(df_page)} dari {total_rows}")
+
+# ==============================================================================
+# PREFETCH VIEW
+# ==============================================================================
+
+KANBAN_STAGES = ['Open', 'Closed Won', 'Closed Lost']
+
+def prefetch_view(view, sales_group, sales_name, is_super):
+    """Panaskan cache data view `view` di background (view belum aktif, tidak ada render)."""
+    scope = (sales_group, sales_name, is_super)
+    sort_by = st.session_state.get('kanban_sort', 'value')
+    if view == "Kanban":
+        data.prefetch(db.get_kanban_summary, *scope)
+        for stage in KANBAN_STAGES:
+            data.prefetch(db.get_kanban_page, *scope, stage, sort_by, after=None)
+    elif view == "Search":
+        data.prefetch(engine.get_dashboard_source, *scope)
+    elif view == "Update Price":
+        data.prefetch(db.get_kanban_data, *scope)
+
+def warm_up(sales_group, sales_name, is_super):
+    """
+    Dipanggil sekali setelah login: Kanban (didahulukan), data Update Price, dashboard,
+    daftar sales & master data dimuat paralel di pool prefetch backend yang terbatas.
+    """
+    for view in ["Kanban", "Update Price", "Search"]:
+        prefetch_view(view, sales_group, sales_name, is_super)
+    data.prefetch(db.get_sales_names)
+    for table_name, column_name in db.master_data_pairs():
+        data.prefetch(db.get_master_data, table_name, column_name)
+
 # ==============================================================================
 # FRAGMENT TABS
 # ==============================================================================
 
 @st.fragment
+@profiling.profiled("kanban")
 def tab1_kanban(sales_group, sales_name, is_super):
     st.header("Kanban View")
     
-    # Load Data
-    df_kanban = db.get_kanban_data(sales_group, sales_name, is_super)
+    # Load Rekap (agregat per stage dari database)
+    with phase("load"):
+        df_summary = data.read(db.get_kanban_summary, sales_group, sales_name, is_super)
 
-    if df_kanban.empty:
+    if df_summary.empty:
         msg = f"Tim {sales_group} belum memiliki opportunity." if is_super else "Anda belum memiliki opportunity."
         st.info(msg)
         return
 
+    stage_stats = df_summary.set_index('stage')
+
+    def stage_count(stage):
+        return int(stage_stats['opp_count'].get(stage, 0))
+
+    def stage_total(stage):
+        return stage_stats['total_value'].get(stage, 0)
+
     # --- Dashboard Metrics ---
-    total_value = df_kanban['selling_price'].sum()
-    total_opps = df_kanban['opportunity_id'].nunique()
-    won_val = df_kanban[df_kanban['stage'] == 'Closed Won']['selling_price'].sum()
+    total_value = df_summary['total_value'].sum()
+    total_opps = df_summary['opp_count'].sum()
+    won_val = stage_total('Closed Won')
 
     m1, m2, m3 = st.columns(3)
     m1.metric("Pipeline Value", f"Rp {format_idr(total_value)}")
@@ -48,20 +137,23 @@ def tab1_kanban(sales_group, sales_name, is_super):
             st.rerun()
         
         # Ambil data header
-        header_row = df_kanban[df_kanban['opportunity_id'] == selected_id]
-        if not header_row.empty:
-            header_data = header_row.iloc[0]
+        with phase("load"):
+            header_data = data.opportunity_header(selected_id)
+        if header_data:
             st.subheader(f"{header_data['opportunity_name']}")
             st.caption(f"Client: {header_data.get('company_name', '-')}")
             st.markdown(f"**Total Price:** Rp {format_idr(header_data['selling_price'])}")
 
             # Ambil Detail Item
             st.markdown("#### Solution Details")
-            df_details = db.get_opportunity_details(selected_id)
+            with phase("load"):
+                df_details = data.opportunity_details(selected_id)
             if not df_details.empty:
-                if 'selling_price' in df_details.columns:
-                    df_details['selling_price'] = df_details['selling_price'].apply(format_idr)
-                st.dataframe(df_details, use_container_width=True)
+                detail_table(
+                    f"kanban_detail_{selected_id}", list(df_details.columns), len(df_details),
+                    lambda by, desc, off, lim: engine.sorted_page(df_details, by, desc, off, lim),
+                    default_sort='selling_price'
+                )
             else:
                 st.info("Tidak ada rincian item.")
         else:
@@ -69,15 +161,23 @@ def tab1_kanban(sales_group, sales_name, is_super):
 
     # --- Kanban Board Logic ---
     else:
-        # Filter Dataframe per Stage
-        open_opps = df_kanban[df_kanban['stage'] == 'Open']
-        won_opps = df_kanban[df_kanban['stage'] == 'Closed Won']
-        lost_opps = df_kanban[df_kanban['stage'] == 'Closed Lost']
+        # Urutan kartu & cursor halaman per stage (reset jika urutan berubah)
+        sort_labels = {"value": "💰 Nilai Tertinggi", "recent": "🕒 Terbaru"}
+        sort_by = st.radio(
+            "Urutkan Kartu", options=list(sort_labels.keys()), 
+            format_func=sort_labels.get, horizontal=True, key="kanban_sort"
+        )
+        if st.session_state.get('kanban_cursor_sort') != sort_by:
+            st.session_state.kanban_cursor_sort = sort_by
+            st.session_state.kanban_cursors = {}
+        cursors = st.session_state.kanban_cursors
 
         # Render Kolom
         c1, c2, c3 = st.columns(3)
 
         def render_card(row, color):
+            profiling.count("cards")
+            profiling.count("widgets", 6)
             with st.container(border=True):
                 st.markdown(f"**{row['opportunity_name']}**")
                 st.caption(f"🏢 {row.get('company_name', '-')}")
@@ -88,181 +188,191 @@ def tab1_kanban(sales_group, sales_name, is_super):
                     st.session_state.selected_kanban_opp_id = row['opportunity_id']
                     st.rerun()
 
+        def load_more(stage, cursor):
+            cursors.setdefault(stage, [None]).append(cursor)
+
+        def render_column(stage, color):
+            # Hanya halaman yang sudah diminta user yang di-render (masing-masing KANBAN_PAGE_SIZE kartu)
+            next_cursor = None
+            for page_cursor in cursors.setdefault(stage, [None]):
+                with phase("load"):
+                    df_page, next_cursor = data.read(db.get_kanban_page, sales_group, sales_name, is_super, stage, sort_by, after=page_cursor)
+                profiling.count("rows", len(df_page))
+                with phase("render"):
+                    for _, row in df_page.iterrows(): render_card(row, color)
+
+            if next_cursor is not None:
+                st.button(
+                    "Muat lebih banyak", key=f"more_{stage}", use_container_width=True,
+                    on_click=load_more, args=(stage, next_cursor)
+                )
+
         with c1:
-            st.markdown(f"### 🟦 Open ({len(open_opps)})")
-            st.markdown(f"**Total: Rp {format_idr(open_opps['selling_price'].sum())}**")
+            st.markdown(f"### 🟦 Open ({stage_count('Open')})")
+            st.markdown(f"**Total: Rp {format_idr(stage_total('Open'))}**")
             st.markdown("---")
-            for _, row in open_opps.iterrows(): render_card(row, "blue")
+            render_column('Open', "blue")
 
         with c2:
-            st.markdown(f"### 🟩 Won ({len(won_opps)})")
-            st.markdown(f"**Total: Rp {format_idr(won_opps['selling_price'].sum())}**")
+            st.markdown(f"### 🟩 Won ({stage_count('Closed Won')})")
+            st.markdown(f"**Total: Rp {format_idr(stage_total('Closed Won'))}**")
             st.markdown("---")
-            for _, row in won_opps.iterrows(): render_card(row, "green")
+            render_column('Closed Won', "green")
 
         with c3:
-            st.markdown(f"### 🟥 Lost ({len(lost_opps)})")
-            st.markdown(f"**Total: Rp {format_idr(lost_opps['selling_price'].sum())}**")
+            st.markdown(f"### 🟥 Lost ({stage_count('Closed Lost')})")
+            st.markdown(f"**Total: Rp {format_idr(stage_total('Closed Lost'))}**")
             st.markdown("---")
-            for _, row in lost_opps.iterrows(): render_card(row, "red")
+            render_column('Closed Lost', "red")
 
 @st.fragment
+@profiling.profiled("dashboard")
 def tab2_dashboard(sales_group, sales_name, is_super):
     st.header("Interactive Dashboard & Search")
     
-    # 1. Load Full Data (Detail Level)
-    with st.spinner("Loading dataset..."):
-        df = db.get_dashboard_data(sales_group, sales_name, is_super)
+    # 1. Load Data: scope kecil -> dataset in-memory (di-cache per versi data),
+    #    scope besar -> mode push-down (filter & agregat dijalankan di SQL)
+    with st.spinner("Loading dataset..."), phase("load"):
+        source = data.read(engine.get_dashboard_source, sales_group, sales_name, is_super, memoize=False)
     
-    if df.empty:
+    if source.empty:
         st.info("No opportunity data available.")
         return
 
-    # --- Pre-processing Data ---
-    # A. Numerik
-    for col in ['cost', 'selling_price']:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-    # B. Tanggal (Prioritas start_date -> created_at)
-    date_col = 'start_date' if 'start_date' in df.columns else 'created_at'
-    if date_col in df.columns:
-        df['filter_date_dt'] = pd.to_datetime(df[date_col], errors='coerce')
-    
-    # C. Handle NULL values (agar filter tidak error)
-    fillna_cols = [
-        'presales_name', 'responsible_name', 'sales_name', 
-        'distributor_name', 'brand', 'pillar', 'solution', 
-        'company_name', 'vertical_industry', 'stage', 
-        'opportunity_name'
-    ]
-    for col in fillna_cols:
-        if col in df.columns:
-            df[col] = df[col].fillna("Unknown").astype(str)
-
     # =================================================================
     # 🎛️ FILTER PANEL (SLICERS)
     # =================================================================
-    with st.container(border=True):
+    # State filter disimpan terpisah dari widget agar tetap utuh saat daftar opsi berubah
+    if 'dash_filters' not in st.session_state: st.session_state.dash_filters = {}
+    filters = {col: st.session_state.dash_filters.get(col, []) for col in engine.SLICER_COLUMNS}
+    date_range = st.session_state.get('dash_date_range', (source.date_min, source.date_max) if source.date_min else None)
+    if not (isinstance(date_range, tuple) and len(date_range) == 2):
+        date_range = None
+
+    # Opsi tiap slicer dihitung dari slicer lain (cascading) beserta jumlah barisnya
+    with phase("filter"):
+        cascade = source.cascading_options(filters, date_range)
+
+    def sync_filter(col, key):
+        st.session_state.dash_filters[col] = st.session_state[key]
+
+    def slicer(label, col):
+        opts, counts = cascade.get(col, ([], {}))
+        profiling.count("widgets")
+        profiling.count("options", len(opts))
+        key = f"dash_sel_{col}"
+        st.session_state[key] = [v for v in filters[col] if v in counts]
+        return st.multiselect(
+            label, opts, key=key,
+            format_func=lambda v: f"{v} ({counts.get(v, 0)})",
+            on_change=sync_filter, args=(col, key)
+        )
+
+    with st.container(border=True), phase("render"):
         st.subheader("🔍 Filter Panel (Slicers)")
-        
-        # Helper untuk mengambil opsi unik yang sudah disortir
-        def get_opts(col_name):
-            return sorted(df[col_name].unique().tolist()) if col_name in df.columns else []
 
         # --- BARIS 1: People & Group ---
         c1, c2, c3, c4 = st.columns(4)
-        with c1: sel_inputter = st.multiselect("Inputter (Presales)", get_opts('presales_name'))
-        with c2: sel_pam = st.multiselect("Presales Manager (PAM)", get_opts('responsible_name'))
-        with c3: sel_sales = st.multiselect("Sales Name", get_opts('sales_name'))
-        with c4: sel_distributor = st.multiselect("Distributor", get_opts('distributor_name'))
+        with c1: slicer("Inputter (Presales)", 'presales_name')
+        with c2: slicer("Presales Manager (PAM)", 'responsible_name')
+        with c3: slicer("Sales Name", 'sales_name')
+        with c4: slicer("Distributor", 'distributor_name')
 
         # --- BARIS 2: Product & Solution ---
         c5, c6, c7, c8 = st.columns(4)
-        with c5: sel_brand = st.multiselect("Brand", get_opts('brand'))
-        with c6: sel_pillar = st.multiselect("Pillar", get_opts('pillar'))
-        with c7: sel_solution = st.multiselect("Solution", get_opts('solution'))
-        with c8: sel_client = st.multiselect("Client / Company", get_opts('company_name'))
+        with c5: slicer("Brand", 'brand')
+        with c6: slicer("Pillar", 'pillar')
+        with c7: slicer("Solution", 'solution')
+        with c8: slicer("Client / Company", 'company_name')
 
         # --- BARIS 3: Context & Time ---
         c9, c10, c11, c12 = st.columns(4)
-        with c9: sel_vertical = st.multiselect("Vertical Industry", get_opts('vertical_industry'))
-        with c10: sel_stage = st.multiselect("Stage", get_opts('stage'))
+        with c9: slicer("Vertical Industry", 'vertical_industry')
+        with c10: slicer("Stage", 'stage')
         with c11: 
             # Date Range Filter
-            date_range = None
-            if 'filter_date_dt' in df.columns:
-                min_d = df['filter_date_dt'].min().date() if not df['filter_date_dt'].isnull().all() else None
-                max_d = df['filter_date_dt'].max().date() if not df['filter_date_dt'].isnull().all() else None
-                if min_d and max_d:
-                    date_range = st.date_input("Start Date Range", value=(min_d, max_d))
-        with c12: sel_opportunity = st.multiselect("Opportunity Name", get_opts('opportunity_name'))
+            if source.date_min and source.date_max:
+                st.date_input("Start Date Range", value=(source.date_min, source.date_max), key="dash_date_range")
+        with c12: slicer("Opportunity Name", 'opportunity_name')
 
     # =================================================================
     # 🔄 FILTER ENGINE
     # =================================================================
-    df_filtered = df.copy()
-    
-    # Mapping Filter Widget ke Kolom DataFrame
-    filters = {
-        'presales_name': sel_inputter, 'responsible_name': sel_pam,
-        'sales_name': sel_sales, 'distributor_name': sel_distributor,
-        'brand': sel_brand, 'pillar': sel_pillar,
-        'solution': sel_solution, 'company_name': sel_client,
-        'vertical_industry': sel_vertical, 'stage': sel_stage,
-        'opportunity_name': sel_opportunity
-    }
-
-    # Apply Filters Loop
-    for col, selection in filters.items():
-        if selection and col in df_filtered.columns:
-            df_filtered = df_filtered[df_filtered[col].isin(selection)]
-
-    # Apply Date Filter
-    if isinstance(date_range, tuple) and len(date_range) == 2 and 'filter_date_dt' in df_filtered.columns:
-        start_d, end_d = date_range
-        mask = (df_filtered['filter_date_dt'].dt.date >= start_d) & (df_filtered['filter_date_dt'].dt.date <= end_d)
-        df_filtered = df_filtered[mask]
+    # In-memory: resolve lewat indeks (interseksi row-id); push-down: WHERE + agregat SQL
+    with phase("filter"):
+        summary = source.query(filters, date_range)
 
     # =================================================================
     # 📊 SUMMARY METRICS
     # =================================================================
     st.markdown("### Summary Metrics")
-    
-    uniq_opps = df_filtered['opportunity_id'].nunique() if 'opportunity_id' in df_filtered.columns else 0
-    uniq_cust = df_filtered['company_name'].nunique() if 'company_name' in df_filtered.columns else 0
-    val_sum = df_filtered['selling_price'].sum() if 'selling_price' in df_filtered.columns else 0
 
     m1, m2, m3 = st.columns(3)
-    m1.metric("Unique Opportunities", f"{uniq_opps}")
-    m2.metric("Total Customers", f"{uniq_cust}")
-    m3.metric("Total Pipeline Value", f"Rp {format_idr(val_sum)}")
+    m1.metric("Unique Opportunities", f"{summary['unique_opportunities']}")
+    m2.metric("Total Customers", f"{summary['unique_customers']}")
+    m3.metric("Total Pipeline Value", f"Rp {format_idr(summary['total_value'])}")
     
     st.divider()
 
     # =================================================================
     # 📋 DATA TABLE
     # =================================================================
-    st.subheader(f"Detailed Data ({len(df_filtered)} rows)")
+    st.subheader(f"Detailed Data ({summary['rows']} rows)")
     
-    if not df_filtered.empty:
-        # Pilih kolom yang relevan untuk ditampilkan
-        desired_columns = [
-            'opportunity_id', 'presales_name', 'sales_name', 'salesgroup_id', 
-            'company_name', 'opportunity_name', 'stage', 
-            'selling_price', 'pillar', 'solution', 'service', 'brand', 'pillar_product', 'solution_product'
-        ]
-        # Filter hanya kolom yang ada
-        final_cols = [c for c in desired_columns if c in df_filtered.columns]
-        
-        df_display = df_filtered[final_cols].copy()
-        
-        # Format Selling Price di tabel
-        if 'selling_price' in df_display.columns:
-            df_display['selling_price'] = df_display['selling_price'].apply(format_idr)
+    if summary['rows'] > 0:
+        # Hanya halaman aktif yang dikirim; sort & paging di tabel Arrow cache atau di SQL (push-down)
+        detail_table(
+            "dash_table", source.table_columns, summary['rows'],
+            lambda by, desc, off, lim: source.page(filters, date_range, by, desc, off, lim),
+            default_sort='opportunity_id'
+        )
 
-        st.dataframe(df_display, use_container_width=True)
+        # --- Export seleksi saat ini (streaming dari database, tidak lewat tabel di atas) ---
+        with st.expander("📥 Export data terfilter"):
+            fmt = st.radio("Format", list(exporter.FORMATS.keys()), horizontal=True, key="dash_export_fmt")
+            if summary['rows'] > exporter.EXPORT_MAX_ROWS:
+                # Download dipegang utuh di memori (bytes + media manager), jadi ukuran export dibatasi
+                st.warning(f"Export dibatasi {exporter.EXPORT_MAX_ROWS} baris; persempit filter ({summary['rows']} baris terpilih).")
+            elif st.button("Siapkan file", key="dash_export_btn"):
+                try:
+                    with st.spinner(f"Mengekspor {summary['rows']} baris..."):
+                        path, rows = exporter.export_dashboard(fmt, sales_group, sales_name, is_super, filters, date_range)
+                        content = exporter.take(path)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    # Tombol hanya dirender di run ini; file sementara sudah dihapus, isi dipegang
+                    # media manager Streamlit sampai rerun berikutnya (klik tidak memicu rerun)
+                    st.download_button(
+                        f"⬇️ Download ({rows} baris)", data=content,
+                        file_name=f"dashboard_export{exporter.FORMATS[fmt]}", key="dash_export_dl", on_click="ignore"
+                    )
     else:
         st.warning("Tidak ada data yang cocok dengan kombinasi filter di atas.")
 
 @st.fragment
+@profiling.profiled("update_price")
 def tab3_update_price(sales_group, sales_name, is_super):
     st.header("Update Price per Item")
     st.info("💡 Edit angka pada kolom 'Selling Price' di dalam tabel secara langsung, lalu klik Simpan.")
 
-    df_price = db.get_kanban_data(sales_group, sales_name, is_super)
+    with phase("load"):
+        df_price = data.read(db.get_kanban_data, sales_group, sales_name, is_super)
     if df_price.empty:
         st.warning("Tidak ada data opportunity.")
         return
 
     # Dropdown Pilih Opportunity
-    opp_dict_p = {f"{row['opportunity_name']}": row['opportunity_id'] for _, row in df_price.iterrows()}
-    sorted_opp_list_p = sorted(opp_dict_p.keys())
+    with phase("preprocess"):
+        opp_dict_p = {f"{row['opportunity_name']}": row['opportunity_id'] for _, row in df_price.iterrows()}
+        sorted_opp_list_p = sorted(opp_dict_p.keys())
+    profiling.count("options", len(sorted_opp_list_p))
     sel_opp_p = st.selectbox("Pilih Opportunity", options=sorted_opp_list_p, index=None, key="tab4_select_opp")
     
     if sel_opp_p:
         oid_p = opp_dict_p[sel_opp_p]
-        header_data = db.get_sales_opportunity_header(oid_p)
+        with phase("load"):
+            header_data = data.opportunity_header(oid_p, fresh=True)
         
         if header_data:
             st.markdown("---")
@@ -273,39 +383,43 @@ def tab3_update_price(sales_group, sales_name, is_super):
             c2.markdown(f"**Presales:** {header_data.get('presales_name', '-')}")
             
             # Ambil data line items
-            df_items = db.get_opportunity_line_items(oid_p)
+            with phase("load"):
+                df_items = data.opportunity_line_items(oid_p)
             
             if not df_items.empty:
                 st.markdown("#### 📦 Rincian Item (Tabel Editor)")
                 
                 # Persiapkan DataFrame untuk diedit
-                edit_df = df_items[['uid', 'pillar', 'solution', 'brand', 'service', 'cost', 'selling_price']].copy()
-                edit_df['cost'] = pd.to_numeric(edit_df['cost'], errors='coerce').fillna(0)
-                edit_df['selling_price'] = pd.to_numeric(edit_df['selling_price'], errors='coerce').fillna(0)
+                with phase("preprocess"):
+                    edit_df = df_items[['uid', 'pillar', 'solution', 'brand', 'service', 'cost', 'selling_price']].copy()
+                    edit_df['cost'] = pd.to_numeric(edit_df['cost'], errors='coerce').fillna(0)
+                    edit_df['selling_price'] = pd.to_numeric(edit_df['selling_price'], errors='coerce').fillna(0)
                 
                 # Render Data Editor
-                edited_df = st.data_editor(
-                    edit_df,
-                    # Kunci semua kolom kecuali 'selling_price'
-                    disabled=['uid', 'solution', 'brand', 'service', 'cost'], 
-                    hide_index=True,
-                    use_container_width=True,
-                    column_config={
-                        "uid": None, # Sembunyikan UID dari layar agar rapi
-                        "pillar": "Pillar",
-                        "solution": "Solution",
-                        "brand": "Brand",
-                        "service": "Service",
-                        "cost": st.column_config.NumberColumn("Cost (Modal)", format="Rp %.0f"),
-                        "selling_price": st.column_config.NumberColumn(
-                            "Selling Price (Edit Sini) ✏️", 
-                            format="Rp %.0f", 
-                            step=1000000, 
-                            min_value=0
-                        )
-                    },
-                    key=f"editor_{oid_p}"
-                )
+                with phase("render"):
+                    edited_df = st.data_editor(
+                        edit_df,
+                        # Kunci semua kolom kecuali 'selling_price'
+                        disabled=['uid', 'solution', 'brand', 'service', 'cost'], 
+                        hide_index=True,
+                        use_container_width=True,
+                        column_config={
+                            "uid": None, # Sembunyikan UID dari layar agar rapi
+                            "pillar": "Pillar",
+                            "solution": "Solution",
+                            "brand": "Brand",
+                            "service": "Service",
+                            "cost": st.column_config.NumberColumn("Cost (Modal)", format="Rp %.0f"),
+                            "selling_price": st.column_config.NumberColumn(
+                                "Selling Price (Edit Sini) ✏️", 
+                                format="Rp %.0f", 
+                                step=1000000, 
+                                min_value=0
+                            )
+                        },
+                        key=f"editor_{oid_p}"
+                    )
+                profiling.count("rows", len(edit_df))
                 
                 # Hitung Margin Real-time berdasarkan hasil edit
                 total_cost = edited_df['cost'].sum()
@@ -347,7 +461,9 @@ def tab3_update_price(sales_group, sales_name, is_super):
                     
                     if changes:
                         with st.spinner("Menyimpan perubahan ke database..."):
-                            res = db.update_line_item_prices(changes, sales_name, oid_p, header_data['opportunity_name'])
+                            res = db.update_line_item_prices(
+                                changes, sales_name, oid_p, header_data['opportunity_name'], header_data['updated_at']
+                            )
                             if res['status'] == 200:
                                 st.success(f"✅ {len(changes)} item berhasil diupdate!")
                                 time.sleep(1.5)
@@ -355,4 +471,46 @@ def tab3_update_price(sales_group, sales_name, is_super):
                             else:
                                 st.error(res['message'])
                     else:
-                        st.info("Tidak ada perubahan angka yang terdeteksi.")
\ No newline at end of file
+                        st.info("Tidak ada perubahan angka yang terdeteksi.")
+
+@st.fragment
+def tab_diagnostics():
+    """Ringkasan instrumentasi backend (khusus super user)."""
+    st.header("🩺 Diagnostics")
+    st.caption(f"Statistik per proses server sejak start/reset. Slow query ≥ {instrumentation.slow_query_ms():.0f} ms.")
+
+    c1, c2 = st.columns([1, 5])
+    if c1.button("🔄 Refresh"):
+        st.rerun(scope="fragment")
+    if c2.button("🗑️ Reset statistik"):
+        instrumentation.reset()
+        st.rerun(scope="fragment")
+
+    df_summary = instrumentation.summary()
+    if df_summary.empty:
+        st.info("Belum ada panggilan backend yang tercatat.")
+        return
+
+    st.subheader("Per fungsi")
+    st.dataframe(
+        df_summary, use_container_width=True, hide_index=True,
+        column_config={"cache_hit_rate": st.column_config.ProgressColumn("cache hit", min_value=0, max_value=1, format="%.2f")}
+    )
+
+    st.subheader("Histogram durasi")
+    fn_name = st.selectbox("Fungsi", df_summary['function'].tolist(), key="diag_fn")
+    st.bar_chart(instrumentation.histogram(fn_name))
+
+    st.subheader("Memori dataset per scope")
+    df_mem = instrumentation.datasets()
+    if df_mem.empty:
+        st.caption("Belum ada dataset besar yang dimuat di proses ini.")
+    else:
+        st.dataframe(df_mem.drop(columns=["bytes"]), use_container_width=True, hide_index=True)
+
+    st.subheader("Slow query log")
+    df_slow = instrumentation.slow_queries()
+    if df_slow.empty:
+        st.success("Tidak ada query di atas ambang.")
+    else:
+        st.dataframe(df_slow.iloc[::-1], use_container_width=True, hide_index=True)